@@ -0,0 +1,88 @@
+'''
+Read path with and without the campaign/client cache.
+
+    python -m benchmarks.bench_cache --reads 20000 --hot 100
+
+Reads are spread over `--hot` campaigns and clients, like repeated API
+lookups of the campaigns being worked on.
+'''
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from clients.crud import ClientCrud
+from clients.models import Client
+from db.base import Base, FilterTypes, make_engine
+from db.cache import cache
+from mailing_list.crud import MailingListCrud
+from mailing_list.models import MailingList, MailingListToClients
+
+
+async def seed(session_maker, rows: int) -> None:
+    async with session_maker() as db:
+        await db.execute(insert(Client), [
+            {'id': i, 'mob_number': 70000000000 + i, 'mob_code': '900',
+             'tag': 'bench', 'time_zone': 0}
+            for i in range(1, rows + 1)
+        ])
+        await db.execute(insert(MailingList), [
+            {'id': i,
+             'start_comm_timestamp': datetime.utcnow(),
+             'end_comm_timestamp': datetime.utcnow() + timedelta(days=1),
+             'text': 'benchmark'}
+            for i in range(1, rows + 1)
+        ])
+        await db.execute(insert(MailingListToClients), [
+            {'mailing_list_id': i, 'filter_type': FilterTypes.tag,
+             'filter_value': 'bench'}
+            for i in range(1, rows + 1)
+        ])
+        await db.commit()
+
+
+async def bench(session_maker, reads: int, hot: int) -> float:
+    async with session_maker() as db:
+        started = time.perf_counter()
+        for _ in range(reads // 2):
+            await MailingListCrud.get(db, random.randint(1, hot))
+            await ClientCrud.get(db, random.randint(1, hot))
+        return reads / (time.perf_counter() - started)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reads', type=int, default=20_000)
+    parser.add_argument('--hot', type=int, default=100,
+                        help='distinct campaigns and clients read')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(
+            f'sqlite+aiosqlite:///{os.path.join(tmp, "cache.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False)
+        await seed(session_maker, args.hot)
+
+        max_size = cache.max_size or 10_000
+        for name, size in (('no cache', 0), ('cache', max_size)):
+            cache.max_size = size
+            cache.clear()
+            rate = await bench(session_maker, args.reads, args.hot)
+            print(f'{name:<9} {rate:10.1f} reads/s')
+        print(cache.stats())
+
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
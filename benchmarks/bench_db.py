@@ -0,0 +1,129 @@
+'''
+Mixed read/write throughput of the DB engine setups.
+
+    python -m benchmarks.bench_db --duration 5
+    python -m benchmarks.bench_db --postgres-url postgresql+asyncpg://...
+
+Writers mark single messages as sent with a commit each, readers run
+the campaign statistic aggregate, all at the same time.
+'''
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from clients.models import Client
+from db.base import Base, SentStatus, make_engine
+from mailing_list.crud import statistic
+from mailing_list.models import MailingList, Message
+
+
+async def seed(session_maker, messages: int) -> int:
+    async with session_maker() as db:
+        mailing_list = MailingList(
+            start_comm_timestamp=datetime.utcnow(),
+            end_comm_timestamp=datetime.utcnow() + timedelta(days=1),
+            text='benchmark'
+        )
+        db.add(mailing_list)
+        await db.flush()
+        await db.execute(insert(Client), [
+            {'id': i, 'mob_number': 70000000000 + i, 'mob_code': '900',
+             'tag': 'bench', 'time_zone': 0}
+            for i in range(1, messages + 1)
+        ])
+        await db.execute(insert(Message), [
+            {'mailing_list_id': mailing_list.id, 'client_id': i}
+            for i in range(1, messages + 1)
+        ])
+        await db.commit()
+        return mailing_list.id
+
+
+async def bench(engine: AsyncEngine,
+                messages: int,
+                writers: int,
+                readers: int,
+                duration: float) -> Dict[str, float]:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = sessionmaker(
+        engine, class_=AsyncSession, expire_on_commit=False)
+    mailing_list_id = await seed(session_maker, messages)
+    deadline = time.perf_counter() + duration
+    counts = {'writes': 0, 'reads': 0, 'errors': 0}
+
+    async def writer() -> None:
+        async with session_maker() as db:
+            while time.perf_counter() < deadline:
+                stmt = (
+                    update(Message).
+                    where(Message.id == random.randint(1, messages)).
+                    values(status=SentStatus.sent,
+                           sent_time=datetime.utcnow())
+                )
+                try:
+                    await db.execute(stmt)
+                    await db.commit()
+                    counts['writes'] += 1
+                except Exception:
+                    await db.rollback()
+                    counts['errors'] += 1
+
+    async def reader() -> None:
+        async with session_maker() as db:
+            while time.perf_counter() < deadline:
+                try:
+                    await statistic(mailing_list_id, db)
+                    await db.commit()
+                    counts['reads'] += 1
+                except Exception:
+                    await db.rollback()
+                    counts['errors'] += 1
+
+    await asyncio.gather(*[writer() for _ in range(writers)],
+                         *[reader() for _ in range(readers)])
+    await engine.dispose()
+    return {key: value / duration for key, value in counts.items()}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=10_000)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--postgres-url', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setups = {
+            'sqlite rollback journal': make_engine(
+                f'sqlite+aiosqlite:///{os.path.join(tmp, "journal.db")}',
+                sqlite_pragmas=False),
+            'sqlite WAL': make_engine(
+                f'sqlite+aiosqlite:///{os.path.join(tmp, "wal.db")}',
+                sqlite_pragmas=True),
+        }
+        if args.postgres_url:
+            setups['postgresql'] = make_engine(args.postgres_url)
+
+        for name, engine in setups.items():
+            result = await bench(engine, args.messages, args.writers,
+                                 args.readers, args.duration)
+            print(f'{name:<24} writes/s={result["writes"]:9.1f} '
+                  f'reads/s={result["reads"]:9.1f} '
+                  f'errors/s={result["errors"]:6.1f}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,101 @@
+'''
+Messages/sec of the dispatcher against a local stub send API.
+
+    python -m benchmarks.bench_dispatch --messages 2000 --latency 0.02
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.stub_api import stub_api
+from clients.models import Client
+from db.base import Base
+from mailing_list.dispatcher import Dispatcher
+from mailing_list.http_client import HttpClient
+from mailing_list.models import MailingList, Message
+from mailing_list.senders import SENDERS, make_sender
+
+
+async def seed(session_maker, messages: int) -> int:
+    async with session_maker() as db:
+        mailing_list = MailingList(
+            start_comm_timestamp=datetime.utcnow() - timedelta(hours=1),
+            end_comm_timestamp=datetime.utcnow() + timedelta(days=1),
+            text='benchmark'
+        )
+        db.add(mailing_list)
+        await db.flush()
+        await db.execute(insert(Client), [
+            {'id': i, 'mob_number': 70000000000 + i, 'mob_code': '900',
+             'tag': 'bench', 'time_zone': 0}
+            for i in range(1, messages + 1)
+        ])
+        await db.execute(insert(Message), [
+            {'mailing_list_id': mailing_list.id, 'client_id': i,
+             'time_zone': 0}
+            for i in range(1, messages + 1)
+        ])
+        await db.commit()
+        return mailing_list.id
+
+
+async def bench(messages: int,
+                concurrency: int,
+                latency: float,
+                mode: str = 'single') -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(
+            f'sqlite+aiosqlite:///{os.path.join(tmp, "bench.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False)
+        mailing_list_id = await seed(session_maker, messages)
+
+        async with stub_api(latency=latency) as url:
+            http = HttpClient(base_url=url)
+            await http.start()
+            dispatcher = Dispatcher(
+                concurrency=concurrency, global_concurrency=concurrency,
+                http=http, sender=make_sender(mode))
+            async with session_maker() as db:
+                started = time.perf_counter()
+                sent = await dispatcher.run('benchmark', mailing_list_id, db)
+                elapsed = time.perf_counter() - started
+            await dispatcher.close()
+            await http.close()
+
+        await engine.dispose()
+
+    assert sent == messages, f'sent {sent} of {messages}'
+    return sent / elapsed
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='stub API response delay, seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+',
+                        default=[1, 4, 16, 64])
+    parser.add_argument('--mode', choices=list(SENDERS), nargs='+',
+                        default=['single'])
+    args = parser.parse_args()
+
+    for mode in args.mode:
+        for concurrency in args.concurrency:
+            rate = await bench(
+                args.messages, concurrency, args.latency, mode)
+            print(f'mode={mode:<7} concurrency={concurrency:<4} '
+                  f'{rate:10.1f} msg/s')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
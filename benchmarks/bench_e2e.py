@@ -0,0 +1,262 @@
+'''
+End-to-end load test: the API served by uvicorn with its in-process
+sender, a scratch SQLite DB created by db_maker and the stub send API.
+
+    python -m benchmarks.bench_e2e --clients 10000 --campaigns 5 \
+        --latency 0.02 --error-rate 0.01 --output e2e.json
+
+Measures the time from creating the campaigns until every one of them
+is done, then p50/p99 latency of client CRUD and statistic requests
+under `--concurrency` concurrent callers. Results are written as JSON
+together with the commit they were taken on, to compare runs.
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+import uvicorn
+from sqlalchemy import func, select
+
+from benchmarks.stub_api import stub_api
+from clients.crud import ClientCrud
+from db.base import DBSession, MailingListState, make_engine
+from db.db_maker import create_db
+from main import app
+from mailing_list.http_client import http_client
+from mailing_list.models import MailingList
+
+CHUNK = 10_000
+MOB_NUMBER = 70000000000
+
+
+async def seed_clients(clients: int, tags: int) -> None:
+    async with DBSession() as db:
+        for start in range(1, clients + 1, CHUNK):
+            await ClientCrud.bulk_upsert(db, [
+                {'mob_number': MOB_NUMBER + i, 'mob_code': '900',
+                 'tag': f'tag{i % tags}', 'time_zone': 0}
+                for i in range(start, min(start + CHUNK, clients + 1))
+            ])
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    samples = sorted(samples)
+    if not samples:
+        return {'count': 0, 'mean': None, 'p50': None, 'p99': None}
+
+    def at(q: float) -> float:
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    return {
+        'count': len(samples),
+        'mean': sum(samples) / len(samples),
+        'p50': at(0.50),
+        'p99': at(0.99)
+    }
+
+
+async def run_campaigns(session: aiohttp.ClientSession,
+                        campaigns: int,
+                        timeout: float) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    started = time.perf_counter()
+    ids = []
+    for i in range(campaigns):
+        async with session.post('/mailing-list/', json={
+            'start_comm_timestamp': now.isoformat(),
+            'end_comm_timestamp': (now + timedelta(days=1)).isoformat(),
+            'text': 'benchmark',
+            'filters': [{'filter_type': 'tag', 'filter_value': f'tag{i}'}]
+        }) as response:
+            ids.append((await response.json())['id'])
+    created = time.perf_counter() - started
+
+    done = 0
+    while time.perf_counter() - started < timeout:
+        async with DBSession() as db:
+            done = (await db.execute(
+                select(func.count()).
+                where(MailingList.id.in_(ids),
+                      MailingList.state == MailingListState.done)
+            )).scalar()
+        if done == len(ids):
+            break
+        await asyncio.sleep(0.1)
+
+    statistics = {}
+    for id in ids:
+        async with session.get(f'/mailing-list/statistic/{id}') as response:
+            statistics[id] = await response.json()
+
+    return {
+        'campaigns': len(ids),
+        'completed': done,
+        'create_seconds': created,
+        'completion_seconds': time.perf_counter() - started,
+        'messages': sum(stat['all_clients_cnt']
+                        for stat in statistics.values()),
+        'sent': sum(stat['sent'] for stat in statistics.values())
+    }
+
+
+async def run_api_load(session: aiohttp.ClientSession,
+                       clients: int,
+                       requests: int,
+                       concurrency: int,
+                       campaign_ids: List[int]) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = {
+        'create_client': [], 'get_client': [], 'update_client': [],
+        'delete_client': [], 'statistic': []
+    }
+    errors = {name: 0 for name in latencies}
+    remaining = requests
+    next_number = MOB_NUMBER + clients + 1
+
+    async def call(name: str, method: str, url: str, **kwargs) -> Any:
+        started = time.perf_counter()
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            latencies[name].append(time.perf_counter() - started)
+            if response.status >= 400:
+                errors[name] += 1
+                return None
+            return json.loads(body) if body else None
+
+    async def caller() -> None:
+        nonlocal remaining, next_number
+        while remaining > 0:
+            remaining -= 1
+            roll = random.random()
+            if roll < 0.15:
+                number, next_number = next_number, next_number + 1
+                created = await call('create_client', 'POST', '/clients/', json={
+                    'mob_number': number, 'mob_code': '900',
+                    'tag': 'load', 'time_zone': 0
+                })
+                if created and random.random() < 0.5:
+                    await call('delete_client', 'DELETE',
+                               f'/clients/{created["id"]}/')
+            elif roll < 0.55:
+                await call('get_client', 'GET',
+                           f'/clients/{random.randint(1, clients)}/')
+            elif roll < 0.7:
+                await call('update_client', 'PUT',
+                           f'/clients/{random.randint(1, clients)}/',
+                           json={'tag': f'tag{random.randint(0, 9)}'})
+            else:
+                await call('statistic', 'GET',
+                           f'/mailing-list/statistic/'
+                           f'{random.choice(campaign_ids)}')
+
+    started = time.perf_counter()
+    await asyncio.gather(*[caller() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': sum(len(samples) for samples in latencies.values()),
+        'seconds': elapsed,
+        'operations': {
+            name: {**percentiles(samples), 'errors': errors[name]}
+            for name, samples in latencies.items()
+        }
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def bench(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(
+            f'sqlite+aiosqlite:///{os.path.join(tmp, "e2e.db")}')
+        DBSession.configure(bind=engine)
+        await create_db(engine)
+        await seed_clients(args.clients, args.campaigns)
+
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        server = uvicorn.Server(uvicorn.Config(app, log_level='warning'))
+
+        async with stub_api(args.latency, args.error_rate) as url:
+            http_client.base_url = url
+            serving = asyncio.create_task(server.serve(sockets=[sock]))
+            while not server.started:
+                await asyncio.sleep(0.05)
+            host, port = sock.getsockname()
+
+            try:
+                async with aiohttp.ClientSession(
+                        f'http://{host}:{port}') as session:
+                    campaigns = await run_campaigns(
+                        session, args.campaigns, args.timeout)
+                    async with DBSession() as db:
+                        campaign_ids = (await db.execute(
+                            select(MailingList.id))).scalars().all()
+                    api = await run_api_load(
+                        session, args.clients, args.requests,
+                        args.concurrency, campaign_ids)
+            finally:
+                server.should_exit = True
+                await serving
+        await engine.dispose()
+
+    return {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'params': vars(args),
+        'campaigns': campaigns,
+        'api': api
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=10_000)
+    parser.add_argument('--campaigns', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='stub API response delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='share of stub API responses that are 500')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='API requests of the latency phase')
+    parser.add_argument('--concurrency', type=int, default=16,
+                        help='concurrent API callers')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='seconds to wait for the campaigns')
+    parser.add_argument('--output', default='bench_e2e.json')
+    args = parser.parse_args()
+
+    result = await bench(args)
+    with open(args.output, 'w') as output:
+        json.dump(result, output, indent=2)
+
+    campaigns = result['campaigns']
+    print(f'campaigns: {campaigns["completed"]}/{campaigns["campaigns"]} '
+          f'done in {campaigns["completion_seconds"]:.2f}s, '
+          f'{campaigns["sent"]}/{campaigns["messages"]} messages sent')
+    for name, stats in result['api']['operations'].items():
+        if stats['count']:
+            print(f'{name:<14} n={stats["count"]:<6} '
+                  f'p50={stats["p50"] * 1000:7.1f}ms '
+                  f'p99={stats["p99"] * 1000:7.1f}ms '
+                  f'errors={stats["errors"]}')
+    print(f'results written to {args.output}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
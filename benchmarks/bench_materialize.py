@@ -0,0 +1,105 @@
+'''
+Time to materialize campaign messages for a tag filter, then to add a
+filter matching 1% of the clients and to edit it, which only touch the
+clients that join or leave.
+
+    python -m benchmarks.bench_materialize --clients 10000 100000 1000000
+'''
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from clients.models import Client
+from clients.segments import rebuild
+from db.base import Base, FilterTypes
+from mailing_list.crud import MailingListCrud
+from mailing_list.models import MailingList, MailingListToClients
+
+CHUNK = 50_000
+
+
+async def seed(session_maker, clients: int) -> MailingList:
+    async with session_maker() as db:
+        for start in range(1, clients + 1, CHUNK):
+            await db.execute(insert(Client), [
+                {'id': i, 'mob_number': 70000000000 + i,
+                 'mob_code': '901' if i % 100 == 0 else '900',
+                 'tag': 'other' if i % 100 == 0 else 'bench',
+                 'time_zone': 0}
+                for i in range(start, min(start + CHUNK, clients + 1))
+            ])
+        await rebuild(db)
+        mailing_list = MailingList(
+            start_comm_timestamp=datetime.utcnow(),
+            end_comm_timestamp=datetime.utcnow() + timedelta(days=1),
+            text='benchmark'
+        )
+        db.add(mailing_list)
+        await db.flush()
+        db.add(MailingListToClients(
+            mailing_list_id=mailing_list.id,
+            filter_type=FilterTypes.tag,
+            filter_value='bench'
+        ))
+        await db.commit()
+        return mailing_list
+
+
+async def bench(clients: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(
+            f'sqlite+aiosqlite:///{os.path.join(tmp, "bench.db")}')
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_maker = sessionmaker(
+            engine, class_=AsyncSession, expire_on_commit=False)
+        mailing_list = await seed(session_maker, clients)
+
+        timings = {}
+        async with session_maker() as db:
+            started = time.perf_counter()
+            created = await mailing_list.create_msgs(db)
+            timings['create'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            added = await MailingListCrud.add_filter(
+                db, mailing_list.id, FilterTypes.mob_code, '901')
+            timings['add filter'] = time.perf_counter() - started
+
+            started = time.perf_counter()
+            edited = await MailingListCrud.update_filter(
+                db, max(filter['id'] for filter in added['filters']),
+                mailing_list.id, filter_value='902')
+            timings['edit filter'] = time.perf_counter() - started
+
+        await engine.dispose()
+
+    edit = clients // 100
+    assert created == clients - edit, f'created {created}'
+    assert added['messages_created'] == edit
+    assert edited['messages_removed'] == edit
+    return timings
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, nargs='+',
+                        default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    for clients in args.clients:
+        timings = await bench(clients)
+        print(f'clients={clients:<8} ' + ' '.join(
+            f'{name}={elapsed:.2f}s' for name, elapsed in timings.items()))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
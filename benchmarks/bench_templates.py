@@ -0,0 +1,63 @@
+'''
+Cost of rendering campaign texts, per 100k messages, with the compiled
+`Template` and with parsing the text for every message.
+
+    python -m benchmarks.bench_templates --messages 100000 --batch 100
+
+Messages are rendered `--batch` at a time, like claimed batches.
+'''
+import argparse
+import time
+from typing import Any, Callable, Dict, List
+
+from mailing_list.templates import Template
+
+TEXTS = {
+    'plain': 'Big sale this weekend only',
+    'one field': 'Hi {tag}, big sale this weekend only',
+    'three fields': 'Hi {tag} ({mob_code}), sale for {mob_number} only'
+}
+
+
+def messages(count: int) -> List[Dict[str, Any]]:
+    return [
+        {'id': i, 'mob_number': 79000000000 + i, 'mob_code': '900',
+         'tag': f'tag{i % 10}', 'time_zone': 0, 'message_id': i,
+         'attempts': 0}
+        for i in range(count)
+    ]
+
+
+def per_message(text: str) -> Callable[[List[Dict[str, Any]]], List[str]]:
+    return lambda msgs: [text.format_map(msg) for msg in msgs]
+
+
+def compiled(text: str) -> Callable[[List[Dict[str, Any]]], List[str]]:
+    return Template(text).render_many
+
+
+def bench(render: Callable[[List[Dict[str, Any]]], List[str]],
+          msgs: List[Dict[str, Any]],
+          batch: int) -> float:
+    started = time.perf_counter()
+    for start in range(0, len(msgs), batch):
+        render(msgs[start:start + batch])
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=100_000)
+    parser.add_argument('--batch', type=int, default=100)
+    args = parser.parse_args()
+
+    msgs = messages(args.messages)
+    scale = 100_000 / args.messages
+    for name, text in TEXTS.items():
+        for kind, make in (('format_map', per_message), ('compiled', compiled)):
+            elapsed = bench(make(text), msgs, args.batch) * scale
+            print(f'{name:<13} {kind:<10} {elapsed * 1000:8.1f}ms/100k')
+
+
+if __name__ == '__main__':
+    main()
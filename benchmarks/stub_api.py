@@ -0,0 +1,55 @@
+import asyncio
+import random
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from aiohttp import web
+
+
+def make_app(latency: float = 0.0, error_rate: float = 0.0) -> web.Application:
+    async def send(request: web.Request) -> web.Response:
+        await request.read()
+        request.app['requests'] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        if random.random() < error_rate:
+            return web.json_response({'code': 1}, status=500)
+        return web.json_response({'code': 0, 'message': 'OK'})
+
+    async def send_batch(request: web.Request) -> web.Response:
+        messages = (await request.json()).get('messages')
+        request.app['requests'] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        return web.json_response({'results': [
+            {'message_id': message.get('message_id'),
+             'status': 500 if random.random() < error_rate else 200}
+            for message in messages
+        ]})
+
+    app = web.Application()
+    app['requests'] = 0
+    app.router.add_post('/send/batch', send_batch)
+    app.router.add_post('/send/{id}', send)
+    return app
+
+
+@asynccontextmanager
+async def stub_api(
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        host: str = '127.0.0.1',
+        port: int = 0) -> AsyncIterator[str]:
+    '''
+    Runs a local stand-in of the send API and yields a base url suitable
+    for SEND_API_URL.
+    '''
+    runner = web.AppRunner(make_app(latency, error_rate))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = runner.addresses[0][1]
+    try:
+        yield f'http://{host}:{port}/send/'
+    finally:
+        await runner.cleanup()
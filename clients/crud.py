@@ -1,8 +1,16 @@
-from sqlalchemy.sql import update
+from typing import Any, Dict, List, Optional
 
-from clients.models import Client
-from db.base import AsyncSession
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.sql import select, update
+
+from clients.models import Client, ClientSegment
+from db.base import AsyncSession, SentStatus
+from db.cache import cache
 from db.mixins import Crud
+from mailing_list.models import Message
+
+# Messages not sent yet; their time zone copy follows the client.
+PENDING = (SentStatus.no_sent, SentStatus.in_progress)
 
 
 class ClientCrud(Crud):
@@ -11,21 +19,45 @@ class ClientCrud(Crud):
     async def create(db: AsyncSession, **kwargs):
         client = Client(**kwargs)
         db.add(client)
+        await db.flush()
+        await ClientSegment.add(db, Client.id == client.id)
         await db.commit()
         return client
 
     @staticmethod
-    async def get(db: AsyncSession, id: int):
-        return await db.get(Client, id)
+    async def get(db: AsyncSession,
+                  id: int,
+                  use_cache: bool = True) -> Optional[Dict[str, Any]]:
+        key = f'client:{id}'
+        if use_cache:
+            client = await cache.get(key)
+            if client is not None:
+                return client
+
+        el = await db.get(Client, id)
+        if el is None:
+            return None
+        client = {
+            column.name: getattr(el, column.name)
+            for column in Client.__table__.columns
+        }
+        await cache.set(key, client)
+        return client
 
     @staticmethod
     async def delete(db: AsyncSession, id: int):
         el = await db.get(Client, id)
+        await ClientSegment.remove(db, Client.id == id)
         await db.delete(el)
         await db.commit()
+        await cache.invalidate(f'client:{id}')
 
     @staticmethod
     async def update(db: AsyncSession, id: int, **kwargs):
+        segments_changed = 'tag' in kwargs or 'mob_code' in kwargs
+        if segments_changed:
+            await ClientSegment.remove(db, Client.id == id)
+
         stmt = (
             update(Client).
             where(Client.id == id).
@@ -33,5 +65,65 @@ class ClientCrud(Crud):
         )
 
         await db.execute(stmt)
+
+        if segments_changed:
+            await ClientSegment.add(db, Client.id == id)
+
+        if 'time_zone' in kwargs:
+            stmt = (
+                update(Message).
+                where(
+                    Message.client_id == id,
+                    Message.status.in_(PENDING)
+                ).
+                values(time_zone=kwargs.get('time_zone')).
+                execution_options(synchronize_session=False)
+            )
+            await db.execute(stmt)
+
         await db.commit()
+        await cache.invalidate(f'client:{id}')
         return await ClientCrud.get(db, id)
+
+    @staticmethod
+    async def bulk_upsert(
+            db: AsyncSession, clients: List[Dict[str, Any]]) -> int:
+        if not clients:
+            return 0
+
+        upserted = Client.mob_number.in_(
+            [client['mob_number'] for client in clients])
+        await ClientSegment.remove(db, upserted)
+
+        dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+        stmt = dialect.insert(Client)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Client.mob_number],
+            set_={
+                column: stmt.excluded[column]
+                for column in ('mob_code', 'tag', 'time_zone')
+            }
+        )
+
+        await db.execute(stmt, clients)
+        await ClientSegment.add(db, upserted)
+
+        upserted_ids = select(Client.id).where(upserted)
+        stmt = (
+            update(Message).
+            where(
+                Message.client_id.in_(upserted_ids),
+                Message.status.in_(PENDING)
+            ).
+            values(time_zone=(
+                select(Client.time_zone).
+                where(Client.id == Message.client_id).
+                scalar_subquery()
+            )).
+            execution_options(synchronize_session=False)
+        )
+        await db.execute(stmt)
+        await db.commit()
+        # Updated rows are matched by mob_number, their ids are unknown.
+        await cache.invalidate_prefix('client:')
+        return len(clients)
@@ -0,0 +1,97 @@
+import codecs
+import csv
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple, Union
+
+from pydantic import ValidationError
+
+from clients.schemas import ClientIn
+
+CSV_TYPES = ('text/csv', )
+NDJSON_TYPES = ('application/x-ndjson', 'application/jsonl',
+                'application/json-seq')
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    tail = ''
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail
+
+
+async def iter_rows(
+        chunks: AsyncIterator[bytes],
+        content_type: str
+        ) -> AsyncIterator[Union[Dict[str, Any], ValueError]]:
+    '''
+    Yields raw rows of a CSV (with a header line) or NDJSON body as it
+    arrives. A row that cannot be parsed at all is yielded as its
+    exception so the caller can report it against its row number.
+    '''
+    header = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        try:
+            if content_type in NDJSON_TYPES:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError('Row must be a JSON object')
+            elif header is None:
+                header = next(csv.reader([line]))
+                continue
+            else:
+                row = dict(zip(header, next(csv.reader([line]))))
+        except ValueError as e:
+            row = e
+        yield row
+
+
+async def iter_client_chunks(
+        chunks: AsyncIterator[bytes],
+        content_type: str,
+        chunk_size: int,
+        max_errors: int = 1000
+        ) -> AsyncIterator[
+            Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]]:
+    '''
+    Validates rows against `ClientIn` and yields them in chunks of up to
+    `chunk_size` rows: the valid clients, the errors of that chunk and
+    how many rows failed. Only the first `max_errors` errors of the
+    whole stream are kept, the rest are only counted.
+    '''
+    clients: List[Dict[str, Any]] = []
+    errors: List[Dict[str, Any]] = []
+    failed = 0
+    kept = 0
+    row_number = 0
+    async for row in iter_rows(chunks, content_type):
+        row_number += 1
+        error = None
+        try:
+            if isinstance(row, Exception):
+                raise row
+            clients.append(ClientIn(**row).dict())
+        except ValidationError as e:
+            error = {'row': row_number, 'errors': e.errors()}
+        except ValueError as e:
+            error = {'row': row_number, 'errors': [{'msg': str(e)}]}
+
+        if error is not None:
+            failed += 1
+            if kept < max_errors:
+                errors.append(error)
+                kept += 1
+
+        if len(clients) + failed >= chunk_size:
+            yield clients, errors, failed
+            clients, errors, failed = [], [], 0
+
+    if clients or failed:
+        yield clients, errors, failed
@@ -1,13 +1,78 @@
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import BigInteger, Column, Enum, ForeignKey, Index, Integer, String
+from sqlalchemy.sql import cast, delete, insert, literal, select, union_all
 
-from db.base import Base
+from db.base import AsyncSession, Base, FilterTypes
 
 
 class Client(Base):
     __tablename__ = 'clients'
 
     id = Column(Integer, primary_key=True)
-    mob_number = Column(Integer, nullable=False)
+    # 11 digits (7XXXXXXXXXX) need 64 bits; int4 on PostgreSQL.
+    mob_number = Column(BigInteger, nullable=False)
     mob_code = Column(String(3), nullable=False)
     tag = Column(String(10))
     time_zone = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_clients_mob_number', 'mob_number', unique=True),
+        Index('ix_clients_tag', 'tag'),
+        Index('ix_clients_mob_code', 'mob_code'),
+    )
+
+
+class ClientSegment(Base):
+    '''
+    Audience index: one row per client and filter it matches, so the
+    clients of any set of filters are an equality lookup on the primary
+    key instead of an OR over the clients table. Kept in step with
+    `clients` by ClientCrud; `python -m clients.segments` rebuilds it.
+    '''
+    __tablename__ = 'client_segments'
+
+    segment_type = Column(Enum(FilterTypes), primary_key=True)
+    segment_value = Column(String, primary_key=True)
+    client_id = Column(
+        Integer, ForeignKey('clients.id'), primary_key=True)
+
+    __table_args__ = (
+        # Segments of one client, to drop them when it changes.
+        Index('ix_client_segments_client',
+              'client_id', 'segment_type', 'segment_value'),
+    )
+
+    @staticmethod
+    async def add(db: AsyncSession, where) -> None:
+        '''Indexes the clients matching `where`, a condition on Client.'''
+        segment_type = ClientSegment.segment_type.type
+        segments = union_all(
+            select(
+                cast(literal(FilterTypes.tag, segment_type), segment_type),
+                Client.tag,
+                Client.id
+            ).
+            where(where, Client.tag.is_not(None)),
+            select(
+                cast(literal(FilterTypes.mob_code, segment_type),
+                     segment_type),
+                Client.mob_code,
+                Client.id
+            ).
+            where(where)
+        )
+        stmt = (
+            insert(ClientSegment).
+            from_select(
+                ['segment_type', 'segment_value', 'client_id'], segments)
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def remove(db: AsyncSession, where) -> None:
+        '''Drops the segments of the clients matching `where`.'''
+        stmt = (
+            delete(ClientSegment).
+            where(ClientSegment.client_id.in_(select(Client.id).where(where))).
+            execution_options(synchronize_session=False)
+        )
+        await db.execute(stmt)
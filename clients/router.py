@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.exc import IntegrityError
 
 from clients.crud import ClientCrud
-from clients.schemas import ClientIn, ClientOut, ClientUpdate
+from clients.importer import CSV_TYPES, NDJSON_TYPES, iter_client_chunks
+from clients.schemas import ClientBulkOut, ClientIn, ClientOut, ClientUpdate
 from db.base import get_db
 
+BULK_CHUNK_SIZE = int(os.getenv('CLIENTS_BULK_CHUNK', 1000))
+BULK_MAX_ERRORS = int(os.getenv('CLIENTS_BULK_MAX_ERRORS', 1000))
+
 clients_router = APIRouter(
     prefix='/clients',
     tags=['clients', ]
@@ -19,7 +26,38 @@ async def create_client(client: ClientIn, db=Depends(get_db)):
     Function for creating client. Args: pydantic model ClientIn
     and db session from async generator.
     '''
-    return await ClientCrud.create(db, **client.dict())
+    try:
+        return await ClientCrud.create(db, **client.dict())
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Client with this mob_number already exists')
+
+
+@clients_router.post('/bulk', response_model=ClientBulkOut)
+async def bulk_create_clients(request: Request, db=Depends(get_db)):
+    '''
+    Creates or updates (by mob_number) clients from a streamed CSV with
+    a header line or NDJSON body. Rows are validated against ClientIn
+    and written in chunks as they arrive; only the first
+    CLIENTS_BULK_MAX_ERRORS row errors are returned.
+    '''
+    content_type = request.headers.get('content-type', '').split(';')[0]
+    if content_type not in CSV_TYPES + NDJSON_TYPES:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail='Body must be text/csv or application/x-ndjson')
+
+    upserted, failed, errors = 0, 0, []
+    async for clients, chunk_errors, chunk_failed in iter_client_chunks(
+            request.stream(), content_type, BULK_CHUNK_SIZE,
+            BULK_MAX_ERRORS):
+        upserted += await ClientCrud.bulk_upsert(db, clients)
+        failed += chunk_failed
+        errors.extend(chunk_errors)
+
+    return {'upserted': upserted, 'failed': failed, 'errors': errors}
 
 
 @clients_router.get('/{id}/', response_model=ClientOut)
@@ -32,14 +70,21 @@ async def get_client(id: int, db=Depends(get_db)):
 
 @clients_router.put('/{id}/', response_model=ClientOut)
 async def update_client(id: int, client: ClientUpdate, db=Depends(get_db)):
-    client_old = await ClientCrud.get(db, id)
+    # Every field is written back, so not from the cache (see db.cache).
+    client_old = await ClientCrud.get(db, id, use_cache=False)
     if not client_old:
         raise HTTPException(status_code=404, detail='Client not found')
 
-    old_data = ClientIn(**client_old.__dict__)
+    old_data = ClientIn(**client_old)
     update_data = client.dict(exclude_unset=True)
     updated_item = old_data.copy(update=update_data)
-    return await ClientCrud.update(db, id, **updated_item.dict())
+    try:
+        return await ClientCrud.update(db, id, **updated_item.dict())
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Client with this mob_number already exists')
 
 
 @clients_router.delete('/{id}/', status_code=status.HTTP_204_NO_CONTENT)
@@ -1,12 +1,12 @@
 import re
-from typing import Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, Field, validator
 
 
 class ClientIn(BaseModel):
     mob_number: int
-    mob_code: int
+    mob_code: str
     tag: str = Field(max_length=10)
     time_zone: int = Field(ge=-12, le=12)
 
@@ -23,7 +23,7 @@ class ClientIn(BaseModel):
         return mob_number
 
     @validator('mob_code')
-    def mob_code_validator(cls, mob_code: int):
+    def mob_code_validator(cls, mob_code: str):
         if len(str(mob_code)) != 3:
             raise ValueError('Mob code length must equals 3')
 
@@ -32,7 +32,7 @@ class ClientIn(BaseModel):
 
 class ClientUpdate(BaseModel):
     mob_number: Optional[int] = None
-    mob_code: Optional[int] = None
+    mob_code: Optional[str] = None
     tag: Optional[str] = Field(default=None, max_length=10)
     time_zone: Optional[int] = Field(default=None, ge=-12, le=12)
 
@@ -42,3 +42,15 @@ class ClientOut(ClientIn):
 
     class Config:
         orm_mode = True
+
+
+class ClientBulkError(BaseModel):
+    row: int = Field(description='Number of the data row, starting at 1')
+    errors: List[Dict[str, Any]]
+
+
+class ClientBulkOut(BaseModel):
+    upserted: int = Field(description='Count created or updated clients')
+    failed: int = Field(description='Count rows rejected by validation')
+    errors: List[ClientBulkError] = Field(
+        description='Errors of the first rejected rows')
@@ -0,0 +1,27 @@
+'''
+Rebuilds the audience index from the clients table, for databases that
+predate it or were written to behind ClientCrud's back.
+
+    python -m clients.segments
+'''
+import asyncio
+
+from sqlalchemy.sql import delete, true
+
+from clients.models import ClientSegment
+from db.base import AsyncSession, DBSession
+
+
+async def rebuild(db: AsyncSession) -> None:
+    await db.execute(delete(ClientSegment))
+    await ClientSegment.add(db, true())
+    await db.commit()
+
+
+async def main() -> None:
+    async with DBSession() as db:
+        await rebuild(db)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
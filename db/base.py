@@ -1,12 +1,67 @@
+import os
 from enum import Enum
+from typing import Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+DATABASE_URL = os.getenv(
+    'DATABASE_URL', 'sqlite+aiosqlite:///test_task_work.db')
 
 Base = declarative_base()
 
-engine = create_async_engine(
-    'sqlite+aiosqlite:///test_task_work.db')
+
+def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    cursor = dbapi_connection.cursor()
+    # Takes effect on new databases (or after VACUUM) and lets archival
+    # give freed pages back in steps with `PRAGMA incremental_vacuum`.
+    cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(
+        f'PRAGMA busy_timeout={int(os.getenv("DB_BUSY_TIMEOUT", 5000))}')
+    cursor.execute(
+        f'PRAGMA mmap_size={int(os.getenv("DB_MMAP_SIZE", 256 * 2 ** 20))}')
+    cursor.close()
+
+
+def make_engine(
+        url: str = DATABASE_URL,
+        sqlite_pragmas: Optional[bool] = None) -> AsyncEngine:
+    '''
+    Engine for `url` with the pool settings from the environment. File
+    based SQLite connections get WAL and the other pragmas of
+    `set_sqlite_pragmas` unless `sqlite_pragmas` is False or
+    DB_SQLITE_PRAGMAS=0.
+    '''
+    pool_options = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 5)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(os.getenv('DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    }
+
+    database = make_url(url)
+    if database.get_backend_name() != 'sqlite':
+        return create_async_engine(
+            url, pool_pre_ping=True, **pool_options)
+
+    if not database.database or database.database == ':memory:':
+        return create_async_engine(url)
+
+    engine = create_async_engine(
+        url, poolclass=AsyncAdaptedQueuePool, **pool_options)
+    if sqlite_pragmas is None:
+        sqlite_pragmas = os.getenv('DB_SQLITE_PRAGMAS', '1') == '1'
+    if sqlite_pragmas:
+        event.listen(engine.sync_engine, 'connect', set_sqlite_pragmas)
+    return engine
+
+
+engine = make_engine()
 
 DBSession: AsyncSession = sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False)
@@ -20,6 +75,15 @@ class FilterTypes(Enum):
 class SentStatus(Enum):
     sent: str = 'sent'
     no_sent: str = 'no_sent'
+    in_progress: str = 'in_progress'
+    failed: str = 'failed'
+
+
+class MailingListState(Enum):
+    scheduled: str = 'scheduled'
+    running: str = 'running'
+    done: str = 'done'
+    archived: str = 'archived'
 
 
 async def get_db():
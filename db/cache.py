@@ -0,0 +1,168 @@
+'''
+Read-through cache of campaign and client rows.
+
+Each process keeps an LRU of up to CACHE_SIZE entries that expire after
+CACHE_TTL seconds. Writes invalidate the affected keys, so a process
+always sees its own writes; other processes see them once their entry
+expires, or at once for the entries they read from a shared backend.
+CACHE_SIZE=0 turns the cache off.
+
+A campaign entry carries its filters, so filter reads are served from
+it and every filter write invalidates it. Read-modify-write paths (the
+PUT handlers and filter changes) read from the DB instead: writing back
+a stale copy from before another process's change would undo it, or
+remove the wrong clients' messages.
+'''
+import copy
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class CacheBackend(ABC):
+    '''
+    Second level shared between processes (e.g. Redis or memcached).
+    Values are plain dicts and lists of JSON-compatible scalars and
+    datetimes.
+    '''
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        pass
+
+    @abstractmethod
+    async def delete_prefix(self, prefix: str) -> None:
+        pass
+
+
+class LocalBackend(CacheBackend):
+    '''In-memory stand-in for a shared backend, for tests and benchmarks.'''
+
+    def __init__(self) -> None:
+        self.values: Dict[str, Tuple[float, Any]] = {}
+
+    async def get(self, key: str) -> Optional[Any]:
+        expires, value = self.values.get(key, (0.0, None))
+        if expires < time.monotonic():
+            self.values.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: Any, ttl: float) -> None:
+        self.values[key] = (time.monotonic() + ttl, value)
+
+    async def delete(self, key: str) -> None:
+        self.values.pop(key, None)
+
+    async def delete_prefix(self, prefix: str) -> None:
+        for key in [key for key in self.values if key.startswith(prefix)]:
+            del self.values[key]
+
+
+BACKENDS = {
+    'none': lambda: None,
+    'local': LocalBackend
+}
+
+
+class Cache:
+
+    def __init__(self,
+                 max_size: int = int(os.getenv('CACHE_SIZE', 10_000)),
+                 ttl: float = float(os.getenv('CACHE_TTL', 60)),
+                 backend: Optional[CacheBackend] = BACKENDS[
+                     os.getenv('CACHE_BACKEND', 'none')]()
+                 ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    async def get(self, key: str) -> Optional[Any]:
+        '''A copy of the cached value, or None.'''
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] >= time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            del self._entries[key]
+
+        if self.backend is not None:
+            value = await self.backend.get(key)
+            if value is not None:
+                self.backend_hits += 1
+                self._store(key, value)
+                return copy.deepcopy(value)
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        value = copy.deepcopy(value)
+        self._store(key, value)
+        if self.backend is not None:
+            await self.backend.set(key, value, self.ttl)
+
+    def _store(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+        if self.backend is not None:
+            await self.backend.delete(key)
+
+    async def invalidate_prefix(self, prefix: str) -> None:
+        for key in [key for key in self._entries if key.startswith(prefix)]:
+            del self._entries[key]
+        if self.backend is not None:
+            await self.backend.delete_prefix(prefix)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.backend_hits + self.misses
+        return {
+            'enabled': self.enabled,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'hits': self.hits,
+            'backend_hits': self.backend_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': ((self.hits + self.backend_hits) / lookups
+                         if lookups else None)
+        }
+
+
+cache = Cache()
@@ -1,11 +1,13 @@
 import asyncio
 
+from sqlalchemy.ext.asyncio import AsyncEngine
+
 from clients.models import Client
 from db.base import Base, engine
 from mailing_list.models import MailingList, MailingListToClients, Message
 
 
-async def create_db():
+async def create_db(engine: AsyncEngine = engine):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,174 @@
+'''
+Checks that the hot queries are served by indexes. Runs them against a
+scratch SQLite DB, records every statement and fails if EXPLAIN QUERY
+PLAN shows a full table scan for any of them, or an index search
+constrained only by low-cardinality columns (enums such as `status`),
+which reads every row with that value.
+
+    python -m db.query_plans
+
+tests/test_query_plans.py runs the same check.
+'''
+import asyncio
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import Boolean, Enum, event
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from clients.crud import ClientCrud
+from db.base import Base, DBSession, FilterTypes, SentStatus, engine
+from mailing_list.crud import (MailingListCrud, MessageArchive, MessageCrud, MessageUpdate,
+                               statistic)
+from mailing_list.models import MailingList, MailingListStats, MailingListToClients
+
+# `SCAN <table>` without an index; `SCAN <table> USING INDEX` still
+# reads the whole index and is reported as well. Sorting for ORDER BY
+# means the rows are not read in index order.
+SCAN = re.compile(r'^(SCAN (?!CONSTANT ROW)\w+|USE TEMP B-TREE FOR ORDER BY)')
+SEARCH = re.compile(
+    r'^SEARCH (?P<table>\w+) USING (?:COVERING )?INDEX \w+ \((?P<terms>.*)\)$')
+
+
+def unselective(detail: str) -> bool:
+    '''An index search whose constrained columns are all enums/flags.'''
+    match = SEARCH.match(detail)
+    table = match and Base.metadata.tables.get(match.group('table'))
+    if table is None:
+        return False
+    columns = [re.match(r'\w+', term).group()
+               for term in match.group('terms').split(' AND ')]
+    return all(
+        column in table.c and isinstance(table.c[column].type, (Enum, Boolean))
+        for column in columns
+    )
+
+
+async def run_hot_queries() -> None:
+    async with DBSession() as db:
+        clients = [
+            await ClientCrud.create(
+                db, mob_number=79000000000 + i, mob_code='900',
+                tag='tag', time_zone=0)
+            for i in range(10)
+        ]
+        await ClientCrud.update(db, clients[0].id, tag='other')
+        await ClientCrud.delete(db, clients[-1].id)
+        await ClientCrud.bulk_upsert(db, [
+            {'mob_number': 79000000000, 'mob_code': '900',
+             'tag': 'tag', 'time_zone': 0}
+        ])
+        mailing_list = MailingList(
+            start_comm_timestamp=datetime.utcnow() - timedelta(hours=1),
+            end_comm_timestamp=datetime.utcnow() + timedelta(hours=1),
+            text='query plans',
+            stats=MailingListStats()
+        )
+        db.add(mailing_list)
+        await db.flush()
+        filter_ = MailingListToClients(
+            mailing_list_id=mailing_list.id,
+            filter_type=FilterTypes.tag,
+            filter_value='tag'
+        )
+        db.add(filter_)
+        await db.commit()
+
+        await MailingListCrud.audience_size(db, [
+            {'filter_type': FilterTypes.tag, 'filter_value': 'tag'},
+            {'filter_type': FilterTypes.mob_code, 'filter_value': '900'}
+        ])
+        await mailing_list.create_msgs(db)
+        await MailingListCrud.update_filter(
+            db, filter_.id, mailing_list.id,
+            filter_type=FilterTypes.mob_code, filter_value='900')
+        added = await MailingListCrud.add_filter(
+            db, mailing_list.id, FilterTypes.tag, 'tag')
+        await MailingListCrud.remove_filter(
+            db, mailing_list.id, max(f['id'] for f in added['filters']))
+        await MailingListCrud.get_pending(db)
+        await MessageUpdate.release_stale_claims(
+            db, mailing_list.id, datetime.utcnow())
+        await MessageUpdate.pending_time_zones(db, mailing_list.id)
+        await MailingListCrud.get_weight(db, mailing_list.id)
+        msgs = await MessageUpdate.claim_msgs_for_sending(
+            db, mailing_list.id, 5, 0)
+        await MessageUpdate.update_many(db, [
+            {'id': msg.get('message_id'), 'mailing_list_id': mailing_list.id,
+             'sent_time': datetime.utcnow(), 'status': SentStatus.sent}
+            for msg in msgs[:-1]
+        ])
+        await MessageUpdate.fail(
+            db, {msgs[-1].get('message_id'): datetime.utcnow()})
+        await MessageUpdate.next_retry_at(db, mailing_list.id)
+        await MessageUpdate.recent_sends(
+            db, datetime.utcnow() - timedelta(days=1))
+        deferred = await MessageUpdate.claim_msgs_for_sending(
+            db, mailing_list.id, 1, 0)
+        await MessageUpdate.defer(db, {
+            msg.get('message_id'): datetime.utcnow() for msg in deferred})
+        await statistic(mailing_list.id, db)
+        await MessageCrud.get_page(db, mailing_list.id, after_id=1, limit=2)
+        await MessageCrud.get_page(
+            db, mailing_list.id, SentStatus.sent, after_id=1, limit=2)
+        async for _ in MessageCrud.stream(db, mailing_list.id):
+            pass
+
+        await MessageArchive.get_finished(db, datetime.utcnow())
+        await MessageArchive.move_chunk(db, mailing_list.id, 5)
+        await MailingListCrud.get_state(db, mailing_list.id)
+        await MessageCrud.get_page(
+            db, mailing_list.id, after_id=1, limit=2, archived=True)
+        async for _ in MessageCrud.stream(
+                db, mailing_list.id, SentStatus.sent, archived=True):
+            pass
+
+
+async def find_scans() -> List[Tuple[str, str]]:
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = create_async_engine(
+            f'sqlite+aiosqlite:///{os.path.join(tmp, "plans.db")}')
+        statements: Dict[str, Any] = {}
+
+        @event.listens_for(scratch.sync_engine, 'before_cursor_execute')
+        def record(conn, cursor, statement, parameters, context, many):
+            if statement.lstrip().upper().startswith(
+                    ('SELECT', 'UPDATE', 'DELETE', 'INSERT')):
+                statements.setdefault(
+                    statement, parameters[0] if many else parameters)
+
+        async with scratch.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+        DBSession.configure(bind=scratch)
+        try:
+            await run_hot_queries()
+        finally:
+            DBSession.configure(bind=engine)
+
+        scans = []
+        async with scratch.connect() as conn:
+            for statement, parameters in statements.items():
+                plan = await conn.exec_driver_sql(
+                    f'EXPLAIN QUERY PLAN {statement}', parameters)
+                for row in plan:
+                    if SCAN.match(row[-1]) or unselective(row[-1]):
+                        scans.append((statement, row[-1]))
+
+        await scratch.dispose()
+    return scans
+
+
+def main() -> int:
+    scans = asyncio.run(find_scans())
+    for statement, detail in scans:
+        print(f'{detail}\n    {" ".join(statement.split())}\n')
+    return 1 if scans else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+'''
+Moves the messages of campaigns that ended more than ARCHIVE_AFTER
+seconds ago (a week by default) out of the hot `messages` table into
+`messages_archive`, then gives the freed pages back to the file system.
+
+    python -m mailing_list.archive                 # archive, then compact
+    python -m mailing_list.archive --chunk 5000 --older-than 86400
+    python -m mailing_list.archive --compact-only
+    python -m mailing_list.archive --vacuum        # one-off full VACUUM
+
+Each chunk of `--chunk` messages is moved in its own transaction and
+each compaction step frees at most `--pages` pages, so the command can
+run next to the API and the workers. Statistics of archived campaigns
+keep coming from their counters, and their messages can still be paged
+and exported. Keep ARCHIVE_AFTER longer than FREQUENCY_CAP_WINDOW: the
+frequency cap only counts sends still in `messages`.
+'''
+import argparse
+import asyncio
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from db.base import DBSession, MailingListState, engine
+from mailing_list.crud import MailingListCrud, MessageArchive
+
+
+async def archive(chunk: int, older_than: float) -> None:
+    ended_before = datetime.utcnow() - timedelta(seconds=older_than)
+    async with DBSession() as db:
+        if db.bind.dialect.name == 'sqlite':
+            # Without AUTOINCREMENT SQLite reuses the ids of deleted rows.
+            sql = (await db.execute(text(
+                "SELECT sql FROM sqlite_master WHERE name = 'messages'"
+            ))).scalar()
+            if 'AUTOINCREMENT' not in (sql or '').upper():
+                print('messages table reuses ids; recreate it with '
+                      '`python -m db.db_maker` before archiving')
+                return
+
+        for mailing_list_id in await MessageArchive.get_finished(
+                db, ended_before):
+            moved = 0
+            while True:
+                count = await MessageArchive.move_chunk(
+                    db, mailing_list_id, chunk)
+                moved += count
+                if count < chunk:
+                    break
+            await MailingListCrud.set_state(
+                db, mailing_list_id, MailingListState.archived)
+            print(f'mailing list {mailing_list_id}: '
+                  f'{moved} messages archived')
+
+
+def compact_sqlite(path: str, pages: int, vacuum: bool = False) -> str:
+    # sqlite3 steps a PRAGMA statement once, which frees a single page;
+    # executescript runs it to completion.
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        conn.execute(
+            f'PRAGMA busy_timeout={int(os.getenv("DB_BUSY_TIMEOUT", 5000))}')
+        if vacuum:
+            conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.execute('VACUUM')
+            return 'vacuumed'
+
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if mode != 2:
+            return (f'{free} free pages; run with --vacuum once to enable '
+                    f'incremental compaction')
+
+        freed = 0
+        while free:
+            conn.executescript(f'PRAGMA incremental_vacuum({pages});')
+            left = conn.execute('PRAGMA freelist_count').fetchone()[0]
+            if left >= free:
+                break
+            freed, free = freed + free - left, left
+        return f'{freed} pages freed'
+    finally:
+        conn.close()
+
+
+async def compact(pages: int, vacuum: bool = False) -> None:
+    '''
+    Frees pages left empty by archival. SQLite databases created with
+    `auto_vacuum=INCREMENTAL` (see `set_sqlite_pragmas`) are shrunk
+    `pages` at a time; older ones need a single `vacuum` first. Other
+    databases reclaim space with their own (auto)vacuum.
+    '''
+    if engine.dialect.name != 'sqlite':
+        print(f'{engine.dialect.name}: left to the database autovacuum')
+        return
+
+    print(await asyncio.to_thread(
+        compact_sqlite, engine.url.database, pages, vacuum))
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chunk', type=int,
+                        default=int(os.getenv('ARCHIVE_CHUNK', 5000)),
+                        help='messages moved per transaction')
+    parser.add_argument('--older-than', type=float,
+                        default=float(os.getenv('ARCHIVE_AFTER', 7 * 86400)),
+                        help='seconds since the campaign end')
+    parser.add_argument('--pages', type=int,
+                        default=int(os.getenv('ARCHIVE_COMPACT_PAGES', 1000)),
+                        help='pages freed per compaction step')
+    parser.add_argument('--compact-only', action='store_true')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='full VACUUM, switches SQLite to incremental')
+    args = parser.parse_args()
+
+    if not (args.compact_only or args.vacuum):
+        await archive(args.chunk, args.older_than)
+    await compact(args.pages, args.vacuum)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,12 +1,19 @@
+from collections import defaultdict
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Union
+from uuid import uuid4
 
-from sqlalchemy.sql import and_, between, case, delete, func, or_, select, update
+from sqlalchemy.engine import Row
+from sqlalchemy.orm import aliased, selectinload
+from sqlalchemy.sql import (and_, bindparam, case, delete, exists, func, insert, literal,
+                            or_, select, union_all, update)
 
-from clients.models import Client
-from db.base import AsyncSession, FilterTypes, SentStatus
+from clients.models import Client, ClientSegment
+from db.base import AsyncSession, FilterTypes, MailingListState, SentStatus
+from db.cache import cache
 from db.mixins import Crud
-from mailing_list.models import MailingList, MailingListToClients, Message
+from mailing_list.models import (NO_SENT, ArchivedMessage, MailingList,
+                                  MailingListStats, MailingListToClients, Message)
 
 
 class MailingListCrud(Crud):
@@ -16,46 +23,98 @@ class MailingListCrud(Crud):
         filters: List[Dict[str, Union[str, int]]] = kwargs.pop('filters')
         mailing_list = MailingList(**kwargs)
 
-        db.add(mailing_list)
-        await db.commit()
-
         tags_codes_add = []
         for filter in filters:
             mailing_list_to_user = MailingListToClients(
-                mailing_list_id=mailing_list.id,
                 filter_type=filter.get('filter_type'),
                 filter_value=filter.get('filter_value')
             )
 
             tags_codes_add.append(mailing_list_to_user)
 
-        db.add_all(tags_codes_add)
+        mailing_list.filters = tags_codes_add
+        mailing_list.stats = MailingListStats()
+        db.add(mailing_list)
 
         await db.commit()
 
-        filters_db = await mailing_list.filters
+        messages_created = await mailing_list.create_msgs(db)
 
-        await mailing_list.create_msgs()
+        return {
+            **mailing_list.__dict__,
+            'messages_created': messages_created
+        }
 
-        return {**mailing_list.__dict__, 'filters': filters_db}
+    @staticmethod
+    def _as_dict(mailing_list: MailingList) -> Dict[str, Any]:
+        return {
+            **{
+                column.name: getattr(mailing_list, column.name)
+                for column in MailingList.__table__.columns
+            },
+            'filters': [
+                {
+                    'id': filter.id,
+                    'filter_type': filter.filter_type,
+                    'filter_value': filter.filter_value
+                }
+                for filter in mailing_list.filters
+            ]
+        }
 
     @staticmethod
-    async def get(db: AsyncSession, id: int) -> Dict[str, Any]:
+    async def get(db: AsyncSession,
+                  id: int,
+                  use_cache: bool = True) -> Dict[str, Any]:
+        key = f'mailing_list:{id}'
+        if use_cache:
+            mailing_list = await cache.get(key)
+            if mailing_list is not None:
+                return mailing_list
+
         stmt = (
             select(MailingList).
-            where(MailingList.id == id)
+            options(selectinload(MailingList.filters)).
+            where(MailingList.id == id).
+            execution_options(populate_existing=True)
         )
         mailing_list = (await db.execute(stmt)).scalar()
         if not mailing_list:
             raise ValueError('Mailing List doesn\'t exists.')
-        filters = await mailing_list.filters
-        return {**mailing_list.__dict__, 'filters': filters}
+
+        mailing_list = MailingListCrud._as_dict(mailing_list)
+        await cache.set(key, mailing_list)
+        return mailing_list
+
+    @staticmethod
+    async def get_list(
+            db: AsyncSession,
+            offset: int = 0,
+            limit: int = 50) -> List[Dict[str, Any]]:
+        stmt = (
+            select(MailingList).
+            options(selectinload(MailingList.filters)).
+            order_by(MailingList.id).
+            offset(offset).
+            limit(limit).
+            execution_options(populate_existing=True)
+        )
+        mailing_lists = (await db.execute(stmt)).scalars()
+        return [{**mailing_list.__dict__} for mailing_list in mailing_lists]
 
     @staticmethod
     async def delete(db: AsyncSession, id: int) -> None:
-        el = await db.get(MailingList, id)
+        el = await db.get(
+            MailingList,
+            id,
+            options=[
+                selectinload(MailingList.filters),
+                selectinload(MailingList.stats)
+            ]
+        )
         await db.delete(el)
         await db.commit()
+        await cache.invalidate(f'mailing_list:{id}')
 
     @staticmethod
     async def update(db: AsyncSession, id: int, **kwargs) -> Dict[str, Any]:
@@ -66,21 +125,195 @@ class MailingListCrud(Crud):
         )
         await db.execute(stmt)
         await db.commit()
+        await cache.invalidate(f'mailing_list:{id}')
         return await MailingListCrud.get(db, id)
 
     @staticmethod
-    async def get_by_filter_id(
-            db: AsyncSession, filter_id: int) -> Dict[str, Any]:
+    async def set_state(
+            db: AsyncSession, id: int, state: MailingListState) -> None:
         stmt = (
-            select(MailingList).
-            join(MailingListToClients).
-            where(MailingListToClients.id == filter_id)
+            update(MailingList).
+            where(MailingList.id == id).
+            values(state=state)
         )
-        mailing_list = (await db.execute(stmt)).scalar()
-        if not mailing_list:
+        await db.execute(stmt)
+        await db.commit()
+        await cache.invalidate(f'mailing_list:{id}')
+
+    @staticmethod
+    async def exists(db: AsyncSession, id: int) -> bool:
+        stmt = select(MailingList.id).where(MailingList.id == id)
+        return (await db.execute(stmt)).first() is not None
+
+    @staticmethod
+    async def get_state(
+            db: AsyncSession, id: int) -> Optional[MailingListState]:
+        stmt = select(MailingList.state).where(MailingList.id == id)
+        return (await db.execute(stmt)).scalar()
+
+    @staticmethod
+    async def get_weight(db: AsyncSession, id: int) -> Optional[int]:
+        stmt = select(MailingList.weight).where(MailingList.id == id)
+        return (await db.execute(stmt)).scalar()
+
+    @staticmethod
+    async def get_window(db: AsyncSession, id: int) -> Optional[Row]:
+        stmt = (
+            select(
+                MailingList.start_comm_timestamp,
+                MailingList.end_comm_timestamp
+            ).
+            where(MailingList.id == id)
+        )
+        return (await db.execute(stmt)).first()
+
+    @staticmethod
+    async def get_pending(db: AsyncSession) -> List[Dict[str, Any]]:
+        stmt = (
+            select(MailingList.id, MailingList.start_comm_timestamp).
+            where(
+                MailingList.state.in_([
+                    MailingListState.scheduled, MailingListState.running]),
+                MailingList.end_comm_timestamp >= datetime.utcnow()
+            )
+        )
+        return [row._asdict() for row in await db.execute(stmt)]
+
+    @staticmethod
+    def _segment(filter_type: FilterTypes, filter_value: str):
+        '''Condition on ClientSegment matching one filter.'''
+        return and_(
+            ClientSegment.segment_type == filter_type,
+            ClientSegment.segment_value == filter_value
+        )
+
+    @staticmethod
+    async def _add_segment(db: AsyncSession,
+                           mailing_list_id: int,
+                           filter_type: FilterTypes,
+                           filter_value: str) -> int:
+        '''Creates messages for segment clients not in the campaign yet.'''
+        joining = (
+            select(
+                literal(datetime.utcnow()),
+                literal(mailing_list_id),
+                Client.id,
+                Client.time_zone,
+                NO_SENT
+            ).
+            select_from(ClientSegment).
+            join(Client, Client.id == ClientSegment.client_id).
+            where(
+                MailingListCrud._segment(filter_type, filter_value),
+                ~exists().where(
+                    Message.client_id == ClientSegment.client_id,
+                    Message.mailing_list_id == mailing_list_id
+                )
+            )
+        )
+        stmt = (
+            insert(Message).
+            from_select(
+                ['sent_time', 'mailing_list_id', 'client_id', 'time_zone',
+                 'status'],
+                joining
+            )
+        )
+
+        result = await db.execute(stmt)
+        await MailingListStats.add_messages(
+            db, mailing_list_id, result.rowcount)
+        return result.rowcount
+
+    @staticmethod
+    async def _remove_segment(db: AsyncSession,
+                              mailing_list_id: int,
+                              filter_type: FilterTypes,
+                              filter_value: str) -> int:
+        '''
+        Deletes unsent messages of segment clients that no filter of the
+        campaign matches any more. Must run after the filters changed.
+        '''
+        matched = aliased(ClientSegment)
+        still_matched = (
+            exists().
+            where(
+                MailingListToClients.mailing_list_id == mailing_list_id,
+                matched.client_id == ClientSegment.client_id,
+                matched.segment_type == MailingListToClients.filter_type,
+                matched.segment_value == MailingListToClients.filter_value
+            )
+        )
+        leaving = (
+            select(ClientSegment.client_id).
+            where(
+                MailingListCrud._segment(filter_type, filter_value),
+                ~still_matched
+            )
+        )
+        stmt = (
+            delete(Message).
+            where(
+                Message.client_id.in_(leaving),
+                Message.mailing_list_id == mailing_list_id,
+                Message.status == SentStatus.no_sent
+            ).
+            execution_options(synchronize_session=False)
+        )
+
+        result = await db.execute(stmt)
+        await MailingListStats.remove_messages(
+            db, mailing_list_id, result.rowcount)
+        return result.rowcount
+
+    @staticmethod
+    async def audience_size(
+            db: AsyncSession, filters: List[Dict[str, Any]]) -> int:
+        '''Count of distinct clients matched by any of `filters`.'''
+        if not filters:
+            return 0
+        stmt = (
+            select(func.count(ClientSegment.client_id.distinct())).
+            where(or_(*[
+                MailingListCrud._segment(
+                    filter['filter_type'], filter['filter_value'])
+                for filter in filters
+            ]))
+        )
+        return (await db.execute(stmt)).scalar()
+
+    @staticmethod
+    async def _get_filter(db: AsyncSession,
+                          mailing_list_id: int,
+                          filter_id: int) -> Row:
+        stmt = (
+            select(
+                MailingListToClients.filter_type,
+                MailingListToClients.filter_value
+            ).
+            where(
+                MailingListToClients.id == filter_id,
+                MailingListToClients.mailing_list_id == mailing_list_id
+            )
+        )
+        filter = (await db.execute(stmt)).first()
+        if not filter:
             raise ValueError('Filter doesn\'t exists.')
-        filters = await mailing_list.filters
-        return {**mailing_list.__dict__, 'filters': filters}
+        return filter
+
+    @staticmethod
+    async def _changed(db: AsyncSession,
+                       mailing_list_id: int,
+                       created: int,
+                       removed: int) -> Dict[str, Any]:
+        await db.commit()
+        await cache.invalidate(f'mailing_list:{mailing_list_id}')
+        mailing_list = await MailingListCrud.get(db, mailing_list_id)
+        return {
+            **mailing_list,
+            'messages_created': created,
+            'messages_removed': removed
+        }
 
     @staticmethod
     async def update_filter(
@@ -89,160 +322,491 @@ class MailingListCrud(Crud):
                 mailing_list_id: int,
                 **kwargs
             ) -> Dict[str, Any]:
-        tag_condition = and_(
-            MailingListToClients.filter_type == FilterTypes.tag,
-            MailingListToClients.filter_value == Client.tag
+        '''
+        Only clients matched by the old filter but by no filter now lose
+        their unsent messages, and only clients of the new filter that
+        are not in the campaign yet get one.
+        '''
+        old = await MailingListCrud._get_filter(
+            db, mailing_list_id, filter_id)
+        stmt = (
+            update(MailingListToClients).
+            where(MailingListToClients.id == filter_id).
+            values(**kwargs)
+        )
+        await db.execute(stmt)
+
+        removed = await MailingListCrud._remove_segment(
+            db, mailing_list_id, old.filter_type, old.filter_value)
+        created = await MailingListCrud._add_segment(
+            db, mailing_list_id,
+            kwargs.get('filter_type', old.filter_type),
+            kwargs.get('filter_value', old.filter_value))
+        return await MailingListCrud._changed(
+            db, mailing_list_id, created, removed)
+
+    @staticmethod
+    async def add_filter(db: AsyncSession,
+                         mailing_list_id: int,
+                         filter_type: FilterTypes,
+                         filter_value: str) -> Dict[str, Any]:
+        if not await MailingListCrud.exists(db, mailing_list_id):
+            raise ValueError('Mailing List doesn\'t exists.')
+
+        db.add(MailingListToClients(
+            mailing_list_id=mailing_list_id,
+            filter_type=filter_type,
+            filter_value=filter_value
+        ))
+        await db.flush()
+
+        created = await MailingListCrud._add_segment(
+            db, mailing_list_id, filter_type, filter_value)
+        return await MailingListCrud._changed(
+            db, mailing_list_id, created, 0)
+
+    @staticmethod
+    async def remove_filter(db: AsyncSession,
+                            mailing_list_id: int,
+                            filter_id: int) -> Dict[str, Any]:
+        old = await MailingListCrud._get_filter(
+            db, mailing_list_id, filter_id)
+        stmt = (
+            delete(MailingListToClients).
+            where(MailingListToClients.id == filter_id).
+            execution_options(synchronize_session=False)
         )
-        mob_code_condition = and_(
-            MailingListToClients.filter_type == FilterTypes.mob_code,
-            MailingListToClients.filter_value == Client.mob_code
+        await db.execute(stmt)
+
+        removed = await MailingListCrud._remove_segment(
+            db, mailing_list_id, old.filter_type, old.filter_value)
+        return await MailingListCrud._changed(
+            db, mailing_list_id, 0, removed)
+
+
+class MessageUpdate:
+
+    @staticmethod
+    async def update_many(
+            db: AsyncSession, msgs: List[Dict[str, Any]]) -> None:
+        messages = Message.__table__
+        stmt = (
+            update(messages).
+            where(messages.c.id == bindparam('msg_id')).
+            values(
+                sent_time=bindparam('msg_sent_time'),
+                status=bindparam('msg_status'),
+                attempts=messages.c.attempts + 1
+            ).
+            execution_options(metric_name='update_many')
         )
 
-        old_filter_clients = (
-            select(Client.id).
-            join(MailingListToClients, or_(tag_condition, mob_code_condition)).
+        await db.execute(stmt, [
+            {
+                'msg_id': msg.get('id'),
+                'msg_sent_time': msg.get('sent_time'),
+                'msg_status': msg.get('status', SentStatus.sent)
+            }
+            for msg in msgs
+        ])
+
+        sent_times: Dict[int, List[datetime]] = defaultdict(list)
+        for msg in msgs:
+            if msg.get('status', SentStatus.sent) == SentStatus.sent:
+                sent_times[msg.get('mailing_list_id')].append(
+                    msg.get('sent_time'))
+        for mailing_list_id, times in sent_times.items():
+            await MailingListStats.add_sent(
+                db, mailing_list_id, len(times), min(times), max(times))
+
+        await db.commit()
+
+    @staticmethod
+    async def claim_msgs_for_sending(
+            db: AsyncSession,
+            mailing_list_id: int,
+            limit: int,
+            time_zone: int,
+            after_id: int = 0
+            ) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        candidates = (
+            select(Message.id).
             where(
-                MailingListToClients.mailing_list_id == mailing_list_id,
-                MailingListToClients.id == filter_id,
+                Message.mailing_list_id == mailing_list_id,
+                Message.status == SentStatus.no_sent,
+                Message.time_zone == time_zone,
+                Message.id > after_id,
+                or_(Message.retry_at.is_(None), Message.retry_at <= now)
             ).
-            distinct()
+            order_by(Message.id).
+            limit(limit).
+            with_for_update(skip_locked=True)
         )
 
-        deleting_old_clients = (
-            delete(Message).
+        # The status check is repeated in the UPDATE itself, so when two
+        # workers race for the same rows each row is claimed only once.
+        claim = uuid4().hex
+        stmt = (
+            update(Message).
             where(
-                Message.client_id.in_(old_filter_clients),
+                Message.id.in_(candidates),
                 Message.status == SentStatus.no_sent
-            )
+            ).
+            values(
+                status=SentStatus.in_progress,
+                claimed_by=claim,
+                claimed_at=now
+            ).
+            execution_options(
+                synchronize_session=False, metric_name='claim_msgs')
         )
 
-        await db.execute(deleting_old_clients)
+        await db.execute(stmt)
         await db.commit()
 
+        claimed = (
+            select(
+                Client.id,
+                Client.mob_number,
+                Client.mob_code,
+                func.coalesce(Client.tag, '').label('tag'),
+                Client.time_zone,
+                Message.id.label('message_id'),
+                Message.attempts
+            ).
+            join(Client).
+            where(Message.claimed_by == claim).
+            order_by(Message.id).
+            execution_options(metric_name='get_claimed_msgs')
+        )
+
+        return [row._asdict() for row in await db.execute(claimed)]
+
+    @staticmethod
+    async def release(db: AsyncSession, ids: Iterable[int]) -> None:
         stmt = (
-            update(MailingListToClients).
-            where(MailingListToClients.id == filter_id).
-            values(**kwargs)
+            update(Message).
+            where(
+                Message.id.in_(list(ids)),
+                Message.status == SentStatus.in_progress
+            ).
+            values(
+                status=SentStatus.no_sent,
+                claimed_by=None,
+                claimed_at=None
+            ).
+            execution_options(synchronize_session=False)
         )
 
         await db.execute(stmt)
         await db.commit()
 
-        existing_clients = (
-            select(Message.client_id).
-            where(Message.mailing_list_id == mailing_list_id)
+    @staticmethod
+    async def fail(db: AsyncSession,
+                   retry_at: Dict[int, Optional[datetime]]) -> None:
+        '''
+        Puts messages whose send failed back until their `retry_at` time,
+        or marks them `failed` when it is None.
+        '''
+        messages = Message.__table__
+        stmt = (
+            update(messages).
+            where(messages.c.id == bindparam('msg_id')).
+            values(
+                status=bindparam('msg_status', type_=messages.c.status.type),
+                attempts=messages.c.attempts + 1,
+                retry_at=bindparam('msg_retry_at'),
+                claimed_by=None,
+                claimed_at=None
+            )
         )
 
-        new_filter_clients = (
-            select(Client.id).
-            join(MailingListToClients, or_(tag_condition, mob_code_condition)).
+        await db.execute(stmt, [
+            {'msg_id': id,
+             'msg_status': SentStatus.no_sent if at else SentStatus.failed,
+             'msg_retry_at': at}
+            for id, at in retry_at.items()
+        ])
+        await db.commit()
+
+    @staticmethod
+    async def defer(db: AsyncSession, retry_at: Dict[int, datetime]) -> None:
+        '''Puts claimed messages back until their `retry_at` time.'''
+        messages = Message.__table__
+        stmt = (
+            update(messages).
             where(
-                MailingListToClients.mailing_list_id == mailing_list_id,
-                MailingListToClients.id == filter_id,
-                Client.id.not_in(existing_clients)
+                messages.c.id == bindparam('msg_id'),
+                messages.c.status == SentStatus.in_progress
             ).
-            distinct()
+            values(
+                status=SentStatus.no_sent,
+                retry_at=bindparam('msg_retry_at'),
+                claimed_by=None,
+                claimed_at=None
+            )
         )
 
-        mailing_list_clients = await db.stream(new_filter_clients)
-        date_add = datetime.utcnow()
+        await db.execute(stmt, [
+            {'msg_id': id, 'msg_retry_at': at}
+            for id, at in retry_at.items()
+        ])
+        await db.commit()
 
-        async for client in mailing_list_clients:
-            msg = Message(
-                sent_time=date_add,
-                mailing_list_id=mailing_list_id,
-                client_id=client[0]
+    @staticmethod
+    async def recent_sends(db: AsyncSession, since: datetime) -> List[Row]:
+        '''(message id, client id, sent time) of messages sent since.'''
+        stmt = (
+            select(Message.id, Message.client_id, Message.sent_time).
+            where(
+                Message.status == SentStatus.sent,
+                Message.sent_time >= since
             )
+        )
 
-            db.add(msg)
-            await db.commit()
-
-        return await MailingListCrud.get_by_filter_id(db, filter_id)
+        return (await db.execute(stmt)).all()
 
+    @staticmethod
+    async def next_retry_at(
+            db: AsyncSession, mailing_list_id: int) -> Optional[datetime]:
+        stmt = (
+            select(func.min(Message.retry_at)).
+            join(MailingList).
+            where(
+                Message.mailing_list_id == mailing_list_id,
+                Message.status == SentStatus.no_sent,
+                Message.retry_at > datetime.utcnow(),
+                Message.retry_at <= MailingList.end_comm_timestamp
+            )
+        )
 
-class MessageUpdate:
+        return (await db.execute(stmt)).scalar()
 
     @staticmethod
-    async def update(db: AsyncSession,
-                     id: int,
-                     time: datetime,
-                     status: SentStatus = SentStatus.sent
-                     ) -> None:
+    async def pending_time_zones(
+            db: AsyncSession, mailing_list_id: int) -> List[int]:
         stmt = (
-            update(Message).
-            where(Message.id == id).
-            values(sent_time=time, status=status)
+            select(Message.time_zone).
+            where(
+                Message.mailing_list_id == mailing_list_id,
+                Message.status == SentStatus.no_sent
+            ).
+            distinct()
         )
 
-        await db.execute(stmt)
-        await db.commit()
+        return (await db.execute(stmt)).scalars().all()
 
     @staticmethod
-    async def get_msg_for_sending(
+    async def release_stale_claims(
             db: AsyncSession,
             mailing_list_id: int,
-            except_client_id: Optional[int] = None
-            ) -> Optional[Dict[str, Any]]:
-        time_condition = (
-            between(
-                Client.time_zone,
-                (func.julianday(MailingList.start_comm_timestamp)
-                 - func.julianday(func.now())) * 24,
-                (func.julianday(MailingList.end_comm_timestamp)
-                 - func.julianday(func.now())) * 24)
+            claimed_before: datetime
+            ) -> int:
+        stmt = (
+            update(Message).
+            where(
+                Message.mailing_list_id == mailing_list_id,
+                Message.status == SentStatus.in_progress,
+                Message.claimed_at < claimed_before
+            ).
+            values(
+                status=SentStatus.no_sent,
+                claimed_by=None,
+                claimed_at=None
+            ).
+            execution_options(synchronize_session=False)
         )
 
+        result = await db.execute(stmt)
+        await db.commit()
+        return result.rowcount
+
+
+class MessageCrud:
+    '''
+    Reads a campaign's messages in id order. Pages and exports continue
+    from the last id seen (keyset pagination), so each of them is a range
+    read of the index however deep into the campaign it is. Messages of
+    archived campaigns are read from `messages_archive`.
+    '''
+
+    @staticmethod
+    def _select(mailing_list_id: int,
+                status: Optional[SentStatus] = None,
+                after_id: int = 0,
+                archived: bool = False):
+        messages = ArchivedMessage if archived else Message
         stmt = (
             select(
-                Client.id,
+                messages.id,
+                messages.client_id,
                 Client.mob_number,
-                Message.id.label('message_id')
+                messages.status,
+                messages.sent_time,
+                messages.attempts
             ).
-            join(Client).
-            join(MailingList).
+            outerjoin(Client, Client.id == messages.client_id).
             where(
-                Message.status == SentStatus.no_sent,
-                time_condition,
-                Message.mailing_list_id == mailing_list_id,
-                Message.client_id != except_client_id,
-                MailingList.end_comm_timestamp >= func.now()
+                messages.mailing_list_id == mailing_list_id,
+                messages.id > after_id
             ).
-            order_by(func.random())
+            order_by(messages.id)
+        )
+        if status is not None:
+            stmt = stmt.where(messages.status == status)
+        return stmt
+
+    @staticmethod
+    async def get_page(db: AsyncSession,
+                       mailing_list_id: int,
+                       status: Optional[SentStatus] = None,
+                       after_id: int = 0,
+                       limit: int = 100,
+                       archived: bool = False) -> List[Dict[str, Any]]:
+        stmt = MessageCrud._select(
+            mailing_list_id, status, after_id, archived)
+        return [row._asdict()
+                for row in await db.execute(stmt.limit(limit))]
+
+    @staticmethod
+    async def stream(db: AsyncSession,
+                     mailing_list_id: int,
+                     status: Optional[SentStatus] = None,
+                     chunk_size: int = 1000,
+                     archived: bool = False
+                     ) -> AsyncIterator[List[Dict[str, Any]]]:
+        '''Yields every matching message, `chunk_size` rows at a time.'''
+        stmt = (
+            MessageCrud._select(
+                mailing_list_id, status, archived=archived).
+            execution_options(yield_per=chunk_size)
+        )
+        result = await db.stream(stmt)
+        async for rows in result.partitions():
+            yield [row._asdict() for row in rows]
+
+
+class MessageArchive:
+    '''
+    Moves the messages of campaigns that ended a while ago to
+    `messages_archive`, one bounded chunk per transaction, so archiving
+    a large campaign never holds a long write lock. The statistic
+    counters live in `mailing_list_stats` and are left untouched.
+    '''
+
+    @staticmethod
+    async def get_finished(
+            db: AsyncSession, ended_before: datetime) -> List[int]:
+        stmt = (
+            select(MailingList.id).
+            where(
+                MailingList.state.in_([
+                    MailingListState.scheduled,
+                    MailingListState.running,
+                    MailingListState.done
+                ]),
+                MailingList.end_comm_timestamp < ended_before
+            )
         )
+        return (await db.execute(stmt)).scalars().all()
 
-        row = (await db.execute(stmt)).first()
-        return row._asdict() if row else row
+    @staticmethod
+    async def move_chunk(db: AsyncSession,
+                         mailing_list_id: int,
+                         limit: int) -> int:
+        '''Moves up to `limit` messages; returns how many were moved.'''
+        stmt = (
+            select(Message.id).
+            where(Message.mailing_list_id == mailing_list_id).
+            order_by(Message.id).
+            limit(limit)
+        )
+        ids = (await db.execute(stmt)).scalars().all()
+        if not ids:
+            return 0
+
+        columns = ['id', 'mailing_list_id', 'client_id', 'status',
+                   'sent_time', 'attempts']
+        await db.execute(
+            insert(ArchivedMessage).
+            from_select(
+                columns,
+                select(*[getattr(Message, column) for column in columns]).
+                where(Message.id.in_(ids))
+            )
+        )
+        await db.execute(
+            delete(Message).
+            where(Message.id.in_(ids)).
+            execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return len(ids)
 
 
 async def statistic(id: int, db: AsyncSession):
+    stmt = (
+        select(MailingList).
+        options(
+            selectinload(MailingList.filters),
+            selectinload(MailingList.stats)
+        ).
+        where(MailingList.id == id).
+        execution_options(populate_existing=True)
+    )
+    mailing_list = (await db.execute(stmt)).scalar()
+    if not mailing_list:
+        raise ValueError('Mailing List doesn\'t exist')
+
+    stats = mailing_list.stats or MailingListStats(
+        all_clients_cnt=0, sent=0)
+    time_for_sending = 0
+    if stats.first_sent_time and stats.last_sent_time:
+        time_for_sending = (
+            stats.last_sent_time - stats.first_sent_time).total_seconds()
+
+    return {
+        'not_sent': stats.all_clients_cnt - stats.sent,
+        'sent': stats.sent,
+        'all_clients_cnt': stats.all_clients_cnt,
+        'time_for_sending': time_for_sending,
+        'filters': mailing_list.filters
+    }
+
+
+async def recompute_statistic(id: int, db: AsyncSession) -> None:
+    messages = union_all(*[
+        select(table.client_id, table.status, table.sent_time).
+        where(table.mailing_list_id == id)
+        for table in (Message, ArchivedMessage)
+    ]).subquery()
+    sent_time = case(
+        (messages.c.status == SentStatus.sent, messages.c.sent_time),
+        else_=None
+    )
     stmt = (
         select(
             func.count(
                 case(
-                    (Message.status == SentStatus.no_sent, Message.client_id),
-                    else_=None
-                )
-            ).label('not_sent'),
-            func.count(
-                case(
-                    (Message.status == SentStatus.sent, Message.client_id),
+                    (messages.c.status == SentStatus.sent,
+                     messages.c.client_id),
                     else_=None
                 )
             ).label('sent'),
-            func.count(Message.client_id).label('all_clients_cnt'),
-            (
-                (func.julianday(func.max(Message.sent_time))
-                 - func.julianday(func.min(Message.sent_time))
-                 ) * 24 * 3600
-            ).label('time_for_sending')
-        ).
-        where(Message.mailing_list_id == id)
+            func.count(messages.c.client_id).label('all_clients_cnt'),
+            func.min(sent_time).label('first_sent_time'),
+            func.max(sent_time).label('last_sent_time')
+        )
     )
 
     row = (await db.execute(stmt)).first()
-    if not row:
-        raise ValueError('Mailing List doesn\'t exist')
-
-    mailing_list = await db.get(MailingList, id)
-    filters = await mailing_list.filters
-    return {**row._asdict(), 'filters': filters}
+    await db.execute(
+        delete(MailingListStats).
+        where(MailingListStats.mailing_list_id == id)
+    )
+    await db.execute(
+        insert(MailingListStats).
+        values(mailing_list_id=id, **row._asdict())
+    )
+    await db.commit()
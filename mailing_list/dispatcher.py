@@ -0,0 +1,273 @@
+import asyncio
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, List, Optional, Set
+
+import aiohttp
+
+from db.base import AsyncSession
+from mailing_list.crud import MailingListCrud, MessageUpdate
+from mailing_list.fair_queue import FairQueue
+from mailing_list.frequency_cap import FrequencyCap, frequency_cap
+from mailing_list.http_client import HttpClient, http_client
+from mailing_list.rate_limit import Throttle, backoff
+from mailing_list.senders import Sender, make_sender
+from mailing_list.templates import compile_template
+from mailing_list.time_zones import next_opening, open_time_zones
+from mailing_list.write_back import StatusWriter
+from metrics.instrumentation import (QUEUE_DEPTH, SEND_DURATION, SENDS_IN_FLIGHT,
+                                     SENT_MESSAGES)
+
+
+def request_status(statuses: List[Optional[int]]) -> Optional[int]:
+    '''Status that stands for a whole request in the throttle's eyes.'''
+    answered = [status for status in statuses if status is not None]
+    healthy = [status for status in answered if 200 <= status < 300]
+    return (healthy or answered or [None])[0]
+
+
+class Dispatcher:
+    '''
+    Sends campaign messages with up to `concurrency` requests in flight
+    per campaign and `global_concurrency` across all campaigns. The
+    endpoint's `Throttle` is shared between campaigns by weight through
+    a `FairQueue`. Every campaign shares the application's `HttpClient`
+    connection pool, and a request carries as many messages as the
+    `Sender` packs into one.
+
+    Messages are claimed from the DB `batch_size` at a time, time zone by
+    time zone among the zones inside the campaign window, and sent from
+    a local buffer that is refilled once it runs low. When nothing can
+    be sent the run sleeps until the next zone opens or retry is due.
+    The campaign text is compiled once and rendered for each claimed
+    batch. Delivered statuses are written back in bulk by `StatusWriter`.
+    Claimed messages of clients over the `FrequencyCap` are put back
+    until the client is under it again. The campaign weight is reread
+    with every claim, so a change made through another process's API
+    takes effect within a batch.
+
+    Requests to each send endpoint pass through its `Throttle`. A failed
+    send is retried after a jittered exponential backoff until it has
+    been tried `max_attempts` times, then it is marked `failed`.
+    '''
+
+    def __init__(self,
+                 concurrency: int = int(os.getenv('SEND_CONCURRENCY', 10)),
+                 global_concurrency: int = int(
+                     os.getenv('SEND_GLOBAL_CONCURRENCY', 100)),
+                 batch_size: int = int(os.getenv('SEND_BATCH_SIZE', 100)),
+                 claim_timeout: int = int(os.getenv('CLAIM_TIMEOUT', 600)),
+                 max_attempts: int = int(os.getenv('SEND_MAX_ATTEMPTS', 5)),
+                 http: HttpClient = http_client,
+                 sender: Optional[Sender] = None,
+                 frequency_cap: FrequencyCap = frequency_cap
+                 ) -> None:
+        self.sender = sender or make_sender()
+        self.concurrency = concurrency
+        self.global_concurrency = global_concurrency
+        # Enough messages buffered to fill every request in flight.
+        self.buffer_size = concurrency * self.sender.batch_size
+        self.batch_size = max(batch_size, self.buffer_size)
+        self.claim_timeout = claim_timeout
+        self.max_attempts = max_attempts
+        self.http = http
+        self.frequency_cap = frequency_cap
+        self._throttles: Dict[str, Throttle] = {}
+        self.fair_queue = self._fair_queue()
+
+    def throttle(self, endpoint: str) -> Throttle:
+        if endpoint not in self._throttles:
+            self._throttles[endpoint] = Throttle(
+                concurrency=self.global_concurrency)
+        return self._throttles[endpoint]
+
+    def _fair_queue(self) -> FairQueue:
+        # Campaigns are granted requests as the endpoint's throttle lets
+        # them through, so the weights share its rate and concurrency.
+        return FairQueue(
+            self.global_concurrency,
+            gate=lambda: self.throttle(self.http.base_url).acquire(),
+            ungate=lambda: self.throttle(self.http.base_url).cancel()
+        )
+
+    async def close(self) -> None:
+        self.fair_queue = self._fair_queue()
+        self._throttles.clear()
+
+    async def _send(self,
+                    mailing_list_id: int,
+                    msgs: List[Dict[str, Any]]) -> List[Optional[int]]:
+        throttle = self.throttle(self.http.base_url)
+        # Also takes a pass through `throttle`, see `_fair_queue`.
+        await self.fair_queue.acquire(mailing_list_id, len(msgs))
+        try:
+            statuses: List[Optional[int]] = [None] * len(msgs)
+            SENDS_IN_FLIGHT.inc()
+            try:
+                with SEND_DURATION.time(sender=type(self.sender).__name__):
+                    statuses = await self.sender.send(msgs, self.http)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            finally:
+                SENDS_IN_FLIGHT.dec()
+                await throttle.release(request_status(statuses))
+                for status in statuses:
+                    SENT_MESSAGES.inc(status=status or 'error')
+            return statuses
+        finally:
+            self.fair_queue.release(mailing_list_id)
+
+    async def run(self,
+                  text: str,
+                  mailing_list_id: int,
+                  db: AsyncSession,
+                  weight: int = 1) -> int:
+        # AsyncSession is not safe for concurrent use, so only the HTTP
+        # calls overlap; reads and writes of `db` go through `db_lock`.
+        try:
+            template = compile_template(text)
+        except ValueError:
+            # Texts saved before templating may hold stray braces or
+            # unknown fields; they are sent as they are.
+            template = compile_template(
+                text.replace('{', '{{').replace('}', '}}'))
+        await self.http.start()
+        self.fair_queue.register(mailing_list_id, weight)
+        db_lock = asyncio.Lock()
+        slots = asyncio.Semaphore(self.concurrency)
+        buffer: Deque[Dict[str, Any]] = deque()
+        tasks: Set[asyncio.Task] = set()
+        after_id = 0
+        sent = 0
+
+        writer = StatusWriter(db, mailing_list_id, db_lock)
+
+        async def send(msgs: List[Dict[str, Any]]) -> None:
+            nonlocal sent
+            try:
+                results = await self._send(mailing_list_id, msgs)
+                failed: Dict[int, Optional[datetime]] = {}
+                for msg, result in zip(msgs, results):
+                    if result == 200:
+                        await writer.add(
+                            msg.get('message_id'), datetime.utcnow())
+                        sent += 1
+                        continue
+
+                    self.frequency_cap.forget([msg])
+                    attempts = msg.get('attempts') + 1
+                    retry_at = None
+                    if attempts < self.max_attempts:
+                        retry_at = (datetime.utcnow()
+                                    + timedelta(seconds=backoff(attempts)))
+                    failed[msg.get('message_id')] = retry_at
+                if failed:
+                    async with db_lock:
+                        await MessageUpdate.fail(db, failed)
+            finally:
+                slots.release()
+
+        async with db_lock:
+            await MessageUpdate.release_stale_claims(
+                db,
+                mailing_list_id,
+                datetime.utcnow() - timedelta(seconds=self.claim_timeout)
+            )
+
+        # Each pass walks the time zones that are open right now, one zone
+        # at a time with an id cursor inside the zone.
+        opened: Optional[datetime] = None
+        zones: Deque[int] = deque()
+        zone: Optional[int] = None
+        claimed = 0
+
+        try:
+            while True:
+                await slots.acquire()
+                while (len(buffer) < self.buffer_size
+                       and (zone is not None or zones)):
+                    if zone is None:
+                        zone, after_id = zones.popleft(), 0
+                    limit = self.batch_size - len(buffer)
+                    async with db_lock:
+                        weight = await MailingListCrud.get_weight(
+                            db, mailing_list_id)
+                        if weight is not None:
+                            self.fair_queue.register(mailing_list_id, weight)
+                        batch = await MessageUpdate.claim_msgs_for_sending(
+                            db, mailing_list_id, limit, zone, after_id)
+                        admitted, deferred = self.frequency_cap.admit(batch)
+                        if deferred:
+                            await MessageUpdate.defer(db, deferred)
+                    if batch:
+                        after_id = batch[-1].get('message_id')
+                        for msg, rendered in zip(
+                                admitted, template.render_many(admitted)):
+                            msg['text'] = rendered
+                        buffer.extend(admitted)
+                        claimed += len(batch)
+                    if len(batch) < limit:
+                        zone = None
+
+                if not buffer:
+                    slots.release()
+                    if tasks:
+                        await asyncio.wait(
+                            tasks, return_when=asyncio.FIRST_COMPLETED)
+                        continue
+
+                    async with db_lock:
+                        window = await MailingListCrud.get_window(
+                            db, mailing_list_id)
+                        pending = await MessageUpdate.pending_time_zones(
+                            db, mailing_list_id)
+                    if window is None or not pending:
+                        break
+
+                    if opened is not None and not claimed:
+                        # Nothing to send now: sleep until a failed send
+                        # is due for retry or a zone with messages opens.
+                        async with db_lock:
+                            retry_at = await MessageUpdate.next_retry_at(
+                                db, mailing_list_id)
+                        wake_at = min(
+                            filter(None, (
+                                retry_at,
+                                next_opening(
+                                    *window, datetime.utcnow(), pending)
+                            )),
+                            default=None
+                        )
+                        if wake_at is None:
+                            break
+                        await asyncio.sleep(
+                            (wake_at - datetime.utcnow()).total_seconds())
+
+                    opened = datetime.utcnow()
+                    zones = deque(open_time_zones(*window, opened, pending))
+                    zone, claimed = None, 0
+                    continue
+
+                chunk = [buffer.popleft() for _ in range(
+                    min(self.sender.batch_size, len(buffer)))]
+                QUEUE_DEPTH.set(len(buffer), mailing_list_id=mailing_list_id)
+                task = asyncio.create_task(send(chunk))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            QUEUE_DEPTH.remove(mailing_list_id=mailing_list_id)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            self.fair_queue.unregister(mailing_list_id)
+            await writer.flush()
+            if buffer:
+                self.frequency_cap.forget(buffer)
+                async with db_lock:
+                    await MessageUpdate.release(
+                        db, [msg.get('message_id') for msg in buffer])
+
+        return sent
+
+
+dispatcher = Dispatcher()
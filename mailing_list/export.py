@@ -0,0 +1,56 @@
+import csv
+import io
+from enum import Enum
+from typing import Any, AsyncIterator, Dict, List
+
+import orjson
+
+FIELDS = ('id', 'client_id', 'mob_number', 'status', 'sent_time', 'attempts')
+
+
+class ExportFormat(Enum):
+    csv: str = 'csv'
+    ndjson: str = 'ndjson'
+
+
+MEDIA_TYPES = {
+    ExportFormat.csv: 'text/csv',
+    ExportFormat.ndjson: 'application/x-ndjson'
+}
+
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+async def iter_csv(
+        chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    yield buffer.getvalue()
+
+    async for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            [_csv_value(row.get(field)) for field in FIELDS] for row in rows)
+        yield buffer.getvalue()
+
+
+async def iter_ndjson(
+        chunks: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    async for rows in chunks:
+        yield b''.join(orjson.dumps(row) + b'\n' for row in rows)
+
+
+def iter_export(chunks: AsyncIterator[List[Dict[str, Any]]],
+                format: ExportFormat) -> AsyncIterator:
+    '''Encodes chunks of message rows as they are read from the DB.'''
+    if format == ExportFormat.ndjson:
+        return iter_ndjson(chunks)
+    return iter_csv(chunks)
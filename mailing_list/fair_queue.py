@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple
+
+Gate = Callable[[], Awaitable[None]]
+
+
+class Flow:
+
+    def __init__(self, weight: int) -> None:
+        self.weight = weight
+        self.deficit = 0
+        self.waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        self.in_flight = 0
+        self.messages = 0
+        # (monotonic time, messages) of the grants inside the rate window.
+        self.recent: Deque[Tuple[float, int]] = deque()
+
+
+class FairQueue:
+    '''
+    Shares `capacity` concurrent send requests between campaigns with
+    deficit round robin. While requests wait, each campaign with waiters
+    in turn earns `weight` quanta of credit and is granted requests as
+    long as its credit covers their cost (the number of messages they
+    carry), so over time campaigns get messages through in proportion
+    to their weights, whatever their size or batch size.
+
+    `gate`, when given, is the send budget behind the queue (the
+    endpoint's rate and concurrency limits). Waiting requests are then
+    granted one at a time: the next one is picked only once `gate` lets
+    a request through, so the weights share that budget rather than a
+    FIFO in front of it. `ungate` gives back a pass no request took.
+
+    With free capacity, no gate and nobody waiting a request is granted
+    at once.
+    '''
+
+    def __init__(self,
+                 capacity: int = int(
+                     os.getenv('SEND_GLOBAL_CONCURRENCY', 100)),
+                 rate_window: float = float(
+                     os.getenv('SEND_RATE_WINDOW', 10)),
+                 gate: Optional[Gate] = None,
+                 ungate: Optional[Gate] = None
+                 ) -> None:
+        self.capacity = capacity
+        self.rate_window = rate_window
+        self.gate = gate
+        self.ungate = ungate
+        self.in_flight = 0
+        self.flows: Dict[int, Flow] = {}
+        self._active: Deque[int] = deque()
+        # Quantum is the largest request cost seen, so a flow is always
+        # served after at most one round of credit.
+        self._quantum = 1
+        self._pump: Optional[asyncio.Task] = None
+        self._freed: Optional[asyncio.Future] = None
+
+    def register(self, flow_id: int, weight: int = 1) -> None:
+        if flow_id in self.flows:
+            self.flows[flow_id].weight = max(weight, 1)
+        else:
+            self.flows[flow_id] = Flow(max(weight, 1))
+
+    def unregister(self, flow_id: int) -> None:
+        flow = self.flows.get(flow_id)
+        if flow is not None and not flow.waiters and not flow.in_flight:
+            del self.flows[flow_id]
+
+    async def acquire(self, flow_id: int, cost: int = 1) -> None:
+        if flow_id not in self.flows:
+            self.register(flow_id)
+        flow = self.flows[flow_id]
+        self._quantum = max(self._quantum, cost)
+
+        if (self.gate is None and self.in_flight < self.capacity
+                and not self._active):
+            self._grant(flow, cost)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        flow.waiters.append((cost, future))
+        if flow_id not in self._active:
+            self._active.append(flow_id)
+        if self._pump is None:
+            self._pump = asyncio.create_task(self._run_pump())
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(flow_id)
+                if self.ungate is not None:
+                    await self.ungate()
+            raise
+
+    def release(self, flow_id: int) -> None:
+        self.in_flight -= 1
+        self.flows[flow_id].in_flight -= 1
+        if self._freed is not None and not self._freed.done():
+            self._freed.set_result(None)
+
+    def _grant(self, flow: Flow, cost: int) -> None:
+        self.in_flight += 1
+        flow.in_flight += 1
+        flow.messages += cost
+        now = time.monotonic()
+        flow.recent.append((now, cost))
+        self._expire(flow, now)
+
+    def _expire(self, flow: Flow, now: float) -> None:
+        while flow.recent and flow.recent[0][0] < now - self.rate_window:
+            flow.recent.popleft()
+
+    def _next(self) -> Optional[Tuple[Flow, int, asyncio.Future]]:
+        '''Takes the waiter deficit round robin serves next.'''
+        while self._active:
+            flow = self.flows[self._active[0]]
+            while flow.waiters and flow.waiters[0][1].cancelled():
+                flow.waiters.popleft()
+            if not flow.waiters:
+                self._active.popleft()
+                flow.deficit = 0
+                continue
+
+            cost, future = flow.waiters[0]
+            if flow.deficit < cost:
+                flow.deficit += self._quantum * flow.weight
+                self._active.rotate(-1)
+                continue
+
+            flow.waiters.popleft()
+            flow.deficit -= cost
+            return flow, cost, future
+        return None
+
+    async def _run_pump(self) -> None:
+        try:
+            while self._active:
+                if self.in_flight >= self.capacity:
+                    self._freed = asyncio.get_running_loop().create_future()
+                    await self._freed
+                    continue
+
+                if self.gate is not None:
+                    await self.gate()
+                waiter = self._next()
+                if waiter is None:
+                    # Every waiter left while the gate was awaited; the
+                    # loop ends unless another one came meanwhile.
+                    if self.ungate is not None:
+                        await self.ungate()
+                    continue
+
+                flow, cost, future = waiter
+                self._grant(flow, cost)
+                future.set_result(None)
+        finally:
+            self._pump = None
+
+    def stats(self) -> Dict[str, Any]:
+        '''Per campaign share of the budget and messages/sec granted.'''
+        now = time.monotonic()
+        flows = {}
+        for flow_id, flow in self.flows.items():
+            self._expire(flow, now)
+            flows[flow_id] = {
+                'weight': flow.weight,
+                'waiting': len(flow.waiters),
+                'in_flight': flow.in_flight,
+                'messages': flow.messages,
+                'messages_per_second': (
+                    sum(cost for _, cost in flow.recent) / self.rate_window)
+            }
+        return {
+            'capacity': self.capacity,
+            'in_flight': self.in_flight,
+            'campaigns': flows
+        }
@@ -0,0 +1,132 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from db.base import DBSession
+from mailing_list.crud import MessageUpdate
+
+
+class FrequencyCap:
+    '''
+    Lets each client receive at most `limit` messages, across every
+    campaign, in any rolling `window` seconds; `limit=1` deduplicates
+    overlapping campaigns. FREQUENCY_CAP=0 turns the cap off.
+
+    The check runs against an in-memory index of recent sends per
+    client, so it costs no DB round trip. A message counts from the
+    moment it is admitted; `forget` takes it back if the send fails.
+    The index is loaded from `Message.sent_time` on `start` and every
+    `sync_interval` seconds picks up the sends of other processes.
+    '''
+
+    def __init__(self,
+                 limit: int = int(os.getenv('FREQUENCY_CAP', 0)),
+                 window: float = float(
+                     os.getenv('FREQUENCY_CAP_WINDOW', 24 * 60 * 60)),
+                 sync_interval: float = float(
+                     os.getenv('FREQUENCY_CAP_SYNC_INTERVAL', 30))
+                 ) -> None:
+        self.limit = limit
+        self.window = timedelta(seconds=window)
+        self.sync_interval = sync_interval
+        # client id -> {message id: send time}
+        self._sends: Dict[int, Dict[int, datetime]] = {}
+        self._synced_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.limit > 0
+
+    def _recent(self, client_id: int, now: datetime) -> Dict[int, datetime]:
+        sends = self._sends.get(client_id, {})
+        expired = [id for id, sent in sends.items()
+                   if sent <= now - self.window]
+        for id in expired:
+            del sends[id]
+        return sends
+
+    def admit(self,
+              msgs: List[Dict[str, Any]],
+              now: Optional[datetime] = None
+              ) -> Tuple[List[Dict[str, Any]], Dict[int, datetime]]:
+        '''
+        Splits claimed messages into the ones that may be sent now and
+        {message id: time the client is under the cap again} for the
+        rest.
+        '''
+        if not self.enabled:
+            return msgs, {}
+
+        now = now or datetime.utcnow()
+        admitted = []
+        deferred = {}
+        for msg in msgs:
+            sends = self._recent(msg.get('id'), now)
+            if len(sends) < self.limit:
+                sends[msg.get('message_id')] = now
+                self._sends[msg.get('id')] = sends
+                admitted.append(msg)
+            else:
+                deferred[msg.get('message_id')] = (
+                    sorted(sends.values())[-self.limit] + self.window)
+        return admitted, deferred
+
+    def forget(self, msgs: List[Dict[str, Any]]) -> None:
+        '''Takes back admitted messages that were not sent.'''
+        for msg in msgs:
+            sends = self._sends.get(msg.get('id'))
+            if sends is not None:
+                sends.pop(msg.get('message_id'), None)
+
+    async def load(self) -> None:
+        '''Adds the sends since the last load, or of the whole window.'''
+        now = datetime.utcnow()
+        # Statuses are written back with a delay, so reread a little
+        # before the last load; known messages are not counted twice.
+        since = now - self.window
+        if self._synced_at is not None:
+            since = max(since, self._synced_at
+                        - timedelta(seconds=self.sync_interval))
+
+        async with DBSession() as db:
+            sends = await MessageUpdate.recent_sends(db, since)
+        for message_id, client_id, sent_time in sends:
+            self._sends.setdefault(client_id, {})[message_id] = sent_time
+
+        for client_id in list(self._sends):
+            if not self._recent(client_id, now):
+                del self._sends[client_id]
+        self._synced_at = now
+
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            await self.load()
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.load()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'limit': self.limit,
+            'window': self.window.total_seconds(),
+            'clients': len(self._sends),
+            'sends': sum(len(sends) for sends in self._sends.values()),
+            'synced_at': self._synced_at
+        }
+
+
+frequency_cap = FrequencyCap()
@@ -0,0 +1,127 @@
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+import orjson
+
+
+class HttpClient:
+    '''
+    Application-scoped HTTP client of the send API. One connection pool
+    is shared by every campaign and kept alive between sends; it is
+    opened by `start()` on API or worker startup and closed on shutdown.
+
+    `limit` caps all open connections and `limit_per_host` the ones to a
+    single host (0 means no cap). Resolved addresses are cached for
+    `dns_ttl` seconds and idle connections are kept for `keepalive`.
+    '''
+
+    def __init__(self,
+                 base_url: str = os.getenv('SEND_API_URL', ''),
+                 token: Optional[str] = os.getenv('SEND_TOKEN'),
+                 limit: int = int(os.getenv('HTTP_POOL_LIMIT', 100)),
+                 limit_per_host: int = int(
+                     os.getenv('HTTP_POOL_LIMIT_PER_HOST', 0)),
+                 dns_ttl: int = int(os.getenv('HTTP_DNS_TTL', 300)),
+                 keepalive: float = float(os.getenv('HTTP_KEEPALIVE', 30)),
+                 timeout: float = float(os.getenv('SEND_TIMEOUT', 10)),
+                 connect_timeout: Optional[float] = float(
+                     os.getenv('HTTP_CONNECT_TIMEOUT', 0)) or None
+                 ) -> None:
+        self.base_url = base_url
+        self.headers = {
+            'Authorization': f'Bearer {token}',
+            'Content-Type': 'application/json'
+        }
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = aiohttp.ClientTimeout(
+            total=timeout, sock_connect=connect_timeout)
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self) -> None:
+        if self._session is not None and not self._session.closed:
+            return
+
+        async def on_create(session, context, params) -> None:
+            self.connections_created += 1
+
+        async def on_reuse(session, context, params) -> None:
+            self.connections_reused += 1
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ttl_dns_cache=self.dns_ttl,
+            keepalive_timeout=self.keepalive
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=self.timeout,
+            headers=self.headers,
+            trace_configs=[trace]
+        )
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            raise RuntimeError('HttpClient is not started')
+        return self._session
+
+    async def post(self, path: str, payload: Dict[str, Any]) -> int:
+        self.requests += 1
+        async with self.session.post(
+            f'{self.base_url}{path}', data=orjson.dumps(payload)
+        ) as response:
+            await response.read()
+            return response.status
+
+    async def post_json(
+            self, path: str, payload: Any) -> Tuple[int, Optional[Any]]:
+        '''Like `post`, also returns the decoded JSON body or None.'''
+        self.requests += 1
+        async with self.session.post(
+            f'{self.base_url}{path}', data=orjson.dumps(payload)
+        ) as response:
+            body = await response.read()
+            try:
+                return response.status, orjson.loads(body)
+            except orjson.JSONDecodeError:
+                return response.status, None
+
+    def stats(self) -> Dict[str, Any]:
+        '''Pool usage, to tune the limits and check connection reuse.'''
+        stats = {
+            'started': self._session is not None,
+            'limit': self.limit,
+            'limit_per_host': self.limit_per_host,
+            'requests': self.requests,
+            'connections_created': self.connections_created,
+            'connections_reused': self.connections_reused,
+            'in_use': 0,
+            'idle': 0
+        }
+        if self._session is not None:
+            connector = self._session.connector
+            # aiohttp has no public counters for these.
+            stats['in_use'] = len(connector._acquired)
+            stats['idle'] = sum(len(conns)
+                                for conns in connector._conns.values())
+        return stats
+
+
+http_client = HttpClient()
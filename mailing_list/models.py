@@ -1,11 +1,12 @@
 from datetime import datetime
-from typing import Any, Dict, List
+from typing import Any, Dict
 
-from sqlalchemy import Column, DateTime, Enum, ForeignKey, Integer, String
-from sqlalchemy.sql import and_, or_, select
+from sqlalchemy import Column, DateTime, Enum, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import and_, case, cast, insert, literal, or_, select, update
 
-from clients.models import Client
-from db.base import Base, DBSession, FilterTypes, SentStatus
+from clients.models import Client, ClientSegment
+from db.base import AsyncSession, Base, FilterTypes, MailingListState, SentStatus
 
 
 class Message(Base):
@@ -16,6 +17,58 @@ class Message(Base):
     status = Column(Enum(SentStatus), default=SentStatus.no_sent)
     mailing_list_id = Column(Integer, ForeignKey('mailing_list.id'))
     client_id = Column(Integer, ForeignKey('clients.id'))
+    # Copy of the client's time zone, so pending messages can be claimed
+    # one time zone bucket at a time straight from the index.
+    time_zone = Column(Integer)
+    claimed_by = Column(String(32))
+    claimed_at = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+    retry_at = Column(DateTime)
+
+    __table_args__ = (
+        # Claiming pending messages of one time zone in id order.
+        Index('ix_messages_mailing_list_status',
+              'mailing_list_id', 'status', 'time_zone', 'id'),
+        # Keyset pages and exports of a campaign's messages.
+        Index('ix_messages_mailing_list_id', 'mailing_list_id', 'id'),
+        Index('ix_messages_client_mailing_list',
+              'client_id', 'mailing_list_id'),
+        Index('ix_messages_claimed_by', 'claimed_by'),
+        # Recent sends of every campaign, for the frequency cap. Led by
+        # sent_time: led by status, the planner takes it for every
+        # `status = ?` lookup and walks all pending messages.
+        Index('ix_messages_sent_time_status',
+              'sent_time', 'status', 'client_id'),
+        # Ids of archived messages must not be handed out again: they
+        # stay unique in `messages_archive` and are the send API's
+        # message ids.
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ArchivedMessage(Base):
+    '''
+    Messages of finished campaigns, moved out of `messages` by
+    `python -m mailing_list.archive` with only the columns still read.
+    '''
+    __tablename__ = 'messages_archive'
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    mailing_list_id = Column(Integer, ForeignKey('mailing_list.id'))
+    client_id = Column(Integer)
+    status = Column(Enum(SentStatus))
+    sent_time = Column(DateTime)
+    attempts = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_messages_archive_mailing_list_id', 'mailing_list_id', 'id'),
+    )
+
+
+# Status of new messages in INSERT ... SELECT. PostgreSQL types a bare
+# parameter in a select list as text, which does not fit the enum.
+NO_SENT = cast(
+    literal(SentStatus.no_sent, Message.status.type), Message.status.type)
 
 
 class MailingListToClients(Base):
@@ -26,6 +79,80 @@ class MailingListToClients(Base):
     filter_type = Column(Enum(FilterTypes))
     filter_value = Column(String)
 
+    __table_args__ = (
+        Index('ix_mailing_list_to_clients_mailing_list',
+              'mailing_list_id', 'filter_type', 'filter_value'),
+    )
+
+
+class MailingListStats(Base):
+    __tablename__ = 'mailing_list_stats'
+
+    mailing_list_id = Column(
+        Integer, ForeignKey('mailing_list.id'), primary_key=True)
+    all_clients_cnt = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    first_sent_time = Column(DateTime)
+    last_sent_time = Column(DateTime)
+
+    @staticmethod
+    def _widen(first: datetime, last: datetime) -> Dict[str, Any]:
+        first_sent_time = MailingListStats.first_sent_time
+        last_sent_time = MailingListStats.last_sent_time
+        return {
+            'first_sent_time': case(
+                (or_(first_sent_time.is_(None), first_sent_time > first),
+                 first),
+                else_=first_sent_time
+            ),
+            'last_sent_time': case(
+                (or_(last_sent_time.is_(None), last_sent_time < last),
+                 last),
+                else_=last_sent_time
+            ),
+        }
+
+    @staticmethod
+    async def add_messages(
+            db: AsyncSession, mailing_list_id: int, count: int) -> None:
+        if not count:
+            return
+        stmt = (
+            update(MailingListStats).
+            where(MailingListStats.mailing_list_id == mailing_list_id).
+            values(all_clients_cnt=MailingListStats.all_clients_cnt + count)
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def remove_messages(
+            db: AsyncSession, mailing_list_id: int, count: int) -> None:
+        if not count:
+            return
+        stmt = (
+            update(MailingListStats).
+            where(MailingListStats.mailing_list_id == mailing_list_id).
+            values(all_clients_cnt=MailingListStats.all_clients_cnt - count)
+        )
+        await db.execute(stmt)
+
+    @staticmethod
+    async def add_sent(
+            db: AsyncSession,
+            mailing_list_id: int,
+            count: int,
+            first: datetime,
+            last: datetime) -> None:
+        stmt = (
+            update(MailingListStats).
+            where(MailingListStats.mailing_list_id == mailing_list_id).
+            values(
+                sent=MailingListStats.sent + count,
+                **MailingListStats._widen(first, last)
+            )
+        )
+        await db.execute(stmt)
+
 
 class MailingList(Base):
     __tablename__ = 'mailing_list'
@@ -34,50 +161,55 @@ class MailingList(Base):
     start_comm_timestamp = Column(DateTime)
     text = Column(String(300))
     end_comm_timestamp = Column(DateTime)
-
-    async def create_msgs(self) -> None:
-        tag_condition = and_(
-            MailingListToClients.filter_type == FilterTypes.tag,
-            MailingListToClients.filter_value == Client.tag
-        )
-        mob_code_condition = and_(
-            MailingListToClients.filter_type == FilterTypes.mob_code,
-            MailingListToClients.filter_value == Client.mob_code
-        )
-
-        stmt = (
-            select(Client.id).
-            join(MailingListToClients, or_(tag_condition, mob_code_condition)).
+    state = Column(Enum(MailingListState), default=MailingListState.scheduled)
+    # Share of the global send budget relative to other running campaigns.
+    weight = Column(Integer, nullable=False, default=1)
+
+    filters = relationship(
+        MailingListToClients,
+        lazy='raise',
+        cascade='all, delete-orphan'
+    )
+    stats = relationship(
+        MailingListStats,
+        lazy='raise',
+        uselist=False,
+        cascade='all, delete-orphan'
+    )
+
+    __table_args__ = (
+        Index('ix_mailing_list_state_end', 'state', 'end_comm_timestamp'),
+    )
+
+    async def create_msgs(self, db: AsyncSession) -> int:
+        mailing_list_clients = (
+            select(
+                literal(datetime.utcnow()),
+                literal(self.id),
+                Client.id,
+                Client.time_zone,
+                NO_SENT
+            ).
+            select_from(MailingListToClients).
+            join(ClientSegment, and_(
+                ClientSegment.segment_type == MailingListToClients.filter_type,
+                ClientSegment.segment_value == MailingListToClients.filter_value
+            )).
+            join(Client, Client.id == ClientSegment.client_id).
             where(MailingListToClients.mailing_list_id == self.id).
             distinct()
         )
 
-        async with DBSession() as db:
-            mailing_list_clients = await db.stream(stmt)
-            date_add = datetime.utcnow()
-
-            async for client in mailing_list_clients:
-                msg = Message(
-                    sent_time=date_add,
-                    mailing_list_id=self.id,
-                    client_id=client[0]
-                )
-
-                db.add(msg)
-                await db.commit()
-
-    @property
-    async def filters(self) -> List[Dict[str, Any]]:
         stmt = (
-            select(
-                MailingListToClients.id,
-                MailingListToClients.filter_type,
-                MailingListToClients.filter_value
-            ).
-            where(MailingListToClients.mailing_list_id == self.id)
+            insert(Message).
+            from_select(
+                ['sent_time', 'mailing_list_id', 'client_id', 'time_zone',
+                 'status'],
+                mailing_list_clients
+            )
         )
 
-        async with DBSession() as db:
-            filters = await db.execute(stmt)
-
-        return [filter._asdict() for filter in filters]
+        result = await db.execute(stmt)
+        await MailingListStats.add_messages(db, self.id, result.rowcount)
+        await db.commit()
+        return result.rowcount
@@ -0,0 +1,119 @@
+import asyncio
+import os
+import random
+import time
+from typing import Optional
+
+
+def backoff(attempt: int,
+            base: float = float(os.getenv('SEND_RETRY_BASE', 1)),
+            cap: float = float(os.getenv('SEND_RETRY_CAP', 300))) -> float:
+    '''Exponential backoff with full jitter, in seconds.'''
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class TokenBucket:
+    '''
+    Allows `rate` acquisitions per second on average and up to `burst`
+    at once. A non-positive rate disables the limit.
+    '''
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AdaptiveLimiter:
+    '''
+    AIMD concurrency limit: grows by one slot per window of healthy
+    responses and is cut by `decrease` on throttling, server errors or
+    timeouts, at most once per `cooldown` seconds.
+    '''
+
+    def __init__(self,
+                 initial: int,
+                 minimum: int = 1,
+                 maximum: Optional[int] = None,
+                 decrease: float = 0.5,
+                 cooldown: float = 1.0) -> None:
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum or initial
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._cond:
+            await self._cond.wait_for(
+                lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, healthy: Optional[bool]) -> None:
+        async with self._cond:
+            self.in_flight -= 1
+            if healthy:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            elif healthy is not None:
+                now = time.monotonic()
+                if now - self._decreased_at >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._decreased_at = now
+            self._cond.notify_all()
+
+
+class Throttle:
+    '''Token bucket and adaptive concurrency limit of one send endpoint.'''
+
+    def __init__(self,
+                 rate: float = float(os.getenv('SEND_RPS', 0)),
+                 burst: Optional[float] = float(os.getenv('SEND_BURST', 0)),
+                 concurrency: int = int(
+                     os.getenv('SEND_GLOBAL_CONCURRENCY', 100))
+                 ) -> None:
+        self.bucket = TokenBucket(rate, burst)
+        self.limiter = AdaptiveLimiter(concurrency)
+
+    async def acquire(self) -> None:
+        await self.limiter.acquire()
+        await self.bucket.acquire()
+
+    async def release(self, status: Optional[int]) -> None:
+        await self.limiter.release(is_healthy(status))
+
+    async def cancel(self) -> None:
+        '''Gives back a slot that was acquired but sent nothing.'''
+        await self.limiter.release(None)
+
+
+def is_healthy(status: Optional[int]) -> Optional[bool]:
+    '''
+    True for a 2xx response, False for the ones that ask us to back off
+    (429, 5xx, timeouts and connection errors) and None for any other
+    status, which says nothing about the provider's capacity.
+    '''
+    if status is None or status == 429 or status >= 500:
+        return False
+    if 200 <= status < 300:
+        return True
+    return None
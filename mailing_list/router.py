@@ -1,10 +1,16 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status
+from typing import List, Optional
 
-from db.base import get_db
-from mailing_list.bg_tasks import bg_mailing
-from mailing_list.crud import MailingListCrud, statistic
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from db.base import MailingListState, SentStatus, get_db
+from mailing_list.crud import MailingListCrud, MessageCrud, statistic
+from mailing_list.dispatcher import dispatcher
+from mailing_list.export import MEDIA_TYPES, ExportFormat, iter_export
+from mailing_list.scheduler import scheduler
 from mailing_list.schemas import (MailingListDetail, MailingListFilter, MailingListIn,
-                                  MailingListOut, MailingListUpdate)
+                                  MailingListOut, MailingListPreview, MailingListPreviewIn,
+                                  MailingListUpdate, MessagePage)
 
 mailing_list_router = APIRouter(
     prefix='/mailing-list',
@@ -12,21 +18,62 @@ mailing_list_router = APIRouter(
 )
 
 
+async def check_not_archived(db, id: int) -> None:
+    '''
+    Messages of archived campaigns left `messages`, so edits that create
+    messages again would send to clients already served.
+    '''
+    if await MailingListCrud.get_state(db, id) == MailingListState.archived:
+        raise HTTPException(status_code=409,
+                            detail='Mailing List is archived')
+
+
 @mailing_list_router.post('/',
                           response_model=MailingListOut,
                           status_code=status.HTTP_201_CREATED
                           )
 async def create_mailing_list(
             mailing_list: MailingListIn,
-            background_task: BackgroundTasks,
             db=Depends(get_db)
         ):
     mailing_list_from_db = await MailingListCrud.create(
         db, **mailing_list.dict())
-    background_task.add_task(bg_mailing, mailing_list_from_db)
+    await scheduler.schedule(
+        mailing_list_from_db.get('id'),
+        mailing_list_from_db.get('start_comm_timestamp'))
     return mailing_list_from_db
 
 
+@mailing_list_router.post('/preview', response_model=MailingListPreview)
+async def preview_mailing_list(
+            preview: MailingListPreviewIn,
+            db=Depends(get_db)
+        ):
+    '''Audience size of the filters, before creating a campaign.'''
+    return {
+        'audience': await MailingListCrud.audience_size(
+            db, preview.dict().get('filters'))
+    }
+
+
+@mailing_list_router.get('/', response_model=List[MailingListOut])
+async def get_mailing_lists(
+            offset: int = Query(default=0, ge=0),
+            limit: int = Query(default=50, ge=1, le=500),
+            db=Depends(get_db)
+        ):
+    return await MailingListCrud.get_list(db, offset, limit)
+
+
+@mailing_list_router.get('/throughput')
+async def get_throughput():
+    '''
+    Campaigns sending in this process: weight, waiting and in-flight
+    requests, and messages/sec over the last SEND_RATE_WINDOW seconds.
+    '''
+    return dispatcher.fair_queue.stats()
+
+
 @mailing_list_router.get('/{id}/', response_model=MailingListOut)
 async def get_mailing_list(id: int, db=Depends(get_db)):
     try:
@@ -39,14 +86,20 @@ async def get_mailing_list(id: int, db=Depends(get_db)):
 async def update_mailing_list(
             id: int,
             mailing_list: MailingListUpdate,
-            background_task: BackgroundTasks,
             db=Depends(get_db)
         ):
-    mailing_list_old = await MailingListCrud.get(db, id)
+    await check_not_archived(db, id)
+    # Every field is written back, so not from the cache (see db.cache).
+    mailing_list_old = await MailingListCrud.get(db, id, use_cache=False)
     if not mailing_list_old:
         raise HTTPException(status_code=404, detail='Mailing List not found')
 
-    old_data = MailingListUpdate(**mailing_list_old)
+    # Stored texts are not validated again: ones saved before templating
+    # may hold stray braces, and are only checked when replaced.
+    old_data = MailingListUpdate.construct(**{
+        field: mailing_list_old.get(field)
+        for field in MailingListUpdate.__fields__
+    })
     update_mailing_list = mailing_list.dict(exclude_unset=True)
     updated_mailing_list = old_data.copy(update=update_mailing_list)
     update_mailing_list_from_db = await MailingListCrud.update(
@@ -55,23 +108,51 @@ async def update_mailing_list(
                              .replace(tzinfo=None)
                              != mailing_list_old.get('start_comm_timestamp'))
     if new_dg_task_condition:
-        background_task.add_task(bg_mailing, update_mailing_list_from_db)
+        await scheduler.schedule(
+            id, update_mailing_list_from_db.get('start_comm_timestamp'))
+    if id in dispatcher.fair_queue.flows:
+        dispatcher.fair_queue.register(
+            id, update_mailing_list_from_db.get('weight'))
     return update_mailing_list_from_db
 
 
 @mailing_list_router.delete('/{id}/', status_code=status.HTTP_204_NO_CONTENT)
 async def delete_mailing_list(id: int, db=Depends(get_db)):
+    scheduler.cancel(id)
     return await MailingListCrud.delete(db, id)
 
 
+@mailing_list_router.post(
+    '/{mailing_list_id}/filter/',
+    response_model=MailingListOut,
+    status_code=status.HTTP_201_CREATED,
+    tags=['filter', ]
+)
+async def add_mailing_list_filter(
+            mailing_list_id: int,
+            filter_: MailingListFilter,
+            db=Depends(get_db)
+        ):
+    await check_not_archived(db, mailing_list_id)
+    try:
+        return await MailingListCrud.add_filter(
+            db, mailing_list_id, **filter_.dict())
+    except ValueError:
+        raise HTTPException(status_code=404, detail='Mailing List not found')
+
+
 @mailing_list_router.put(
-    '/{mailing_list_id}/filter/{filter_id}/', tags=['filter', ])
+    '/{mailing_list_id}/filter/{filter_id}/',
+    response_model=MailingListOut,
+    tags=['filter', ]
+)
 async def update_mailing_list_filter(
             mailing_list_id: int,
             filter_id: int,
             filter_: MailingListFilter,
             db=Depends(get_db)
         ):
+    await check_not_archived(db, mailing_list_id)
     try:
         return await MailingListCrud.update_filter(
             db, filter_id, mailing_list_id, **filter_.dict())
@@ -79,6 +160,78 @@ async def update_mailing_list_filter(
         raise HTTPException(status_code=404, detail='Filter not found')
 
 
+@mailing_list_router.delete(
+    '/{mailing_list_id}/filter/{filter_id}/',
+    response_model=MailingListOut,
+    tags=['filter', ]
+)
+async def remove_mailing_list_filter(
+            mailing_list_id: int,
+            filter_id: int,
+            db=Depends(get_db)
+        ):
+    await check_not_archived(db, mailing_list_id)
+    try:
+        return await MailingListCrud.remove_filter(
+            db, mailing_list_id, filter_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail='Filter not found')
+
+
 @mailing_list_router.get('/statistic/{id}', response_model=MailingListDetail)
 async def statistic_handler(id: int, db=Depends(get_db)):
-    return await statistic(id, db)
+    try:
+        return await statistic(id, db)
+    except ValueError:
+        raise HTTPException(status_code=404, detail='Mailing List not found')
+
+
+@mailing_list_router.get('/{id}/messages', response_model=MessagePage)
+async def get_messages(
+            id: int,
+            status: Optional[SentStatus] = None,
+            after: int = Query(default=0, ge=0),
+            limit: int = Query(default=100, ge=1, le=1000),
+            db=Depends(get_db)
+        ):
+    '''
+    Campaign messages in id order, `limit` at a time. `after` is the
+    `next_after` of the previous page.
+    '''
+    state = await MailingListCrud.get_state(db, id)
+    if state is None:
+        raise HTTPException(status_code=404, detail='Mailing List not found')
+
+    items = await MessageCrud.get_page(
+        db, id, status, after, limit,
+        archived=state == MailingListState.archived)
+    return {
+        'items': items,
+        'next_after': items[-1].get('id') if len(items) == limit else None
+    }
+
+
+@mailing_list_router.get('/{id}/messages/export')
+async def export_messages(
+            id: int,
+            format: ExportFormat = ExportFormat.csv,
+            status: Optional[SentStatus] = None,
+            db=Depends(get_db)
+        ):
+    '''
+    Streams all campaign messages as CSV or NDJSON while they are read,
+    so memory use does not depend on the campaign size.
+    '''
+    state = await MailingListCrud.get_state(db, id)
+    if state is None:
+        raise HTTPException(status_code=404, detail='Mailing List not found')
+
+    chunks = MessageCrud.stream(
+        db, id, status, archived=state == MailingListState.archived)
+    return StreamingResponse(
+        iter_export(chunks, format),
+        media_type=MEDIA_TYPES[format],
+        headers={'Content-Disposition': (
+            f'attachment; filename="mailing_list_{id}_messages.'
+            f'{format.value}"')}
+    )
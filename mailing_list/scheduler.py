@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from db.base import DBSession, MailingListState
+from mailing_list.crud import MailingListCrud
+from mailing_list.dispatcher import dispatcher
+
+
+class Scheduler:
+    '''
+    Starts campaigns at their `start_comm_timestamp`. Due times live in
+    the DB (`start_comm_timestamp` and `state` of `MailingList`), so
+    `start` picks every unfinished campaign up again after a restart.
+    In memory they are kept in a timer heap; rescheduling a campaign
+    replaces its entry instead of adding a second task.
+
+    With `poll_interval` set the DB is re-read periodically, so campaigns
+    created or rescheduled by other processes (the API server, when the
+    sender runs in separate workers) are picked up as well.
+    '''
+
+    def __init__(self) -> None:
+        self._heap: List[Tuple[datetime, int]] = []
+        self._due: Dict[int, datetime] = {}
+        self._running: Dict[int, asyncio.Task] = {}
+        self._started: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, poll_interval: Optional[float] = None) -> None:
+        self._wakeup = asyncio.Event()
+        await self.refresh()
+        self._tasks.append(asyncio.create_task(self._loop()))
+        if poll_interval:
+            self._tasks.append(
+                asyncio.create_task(self._poll(poll_interval)))
+
+    async def stop(self) -> None:
+        tasks = [*self._running.values(), *self._tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._heap.clear()
+        self._due.clear()
+        self._running.clear()
+        self._started.clear()
+
+    async def refresh(self) -> None:
+        async with DBSession() as db:
+            pending = await MailingListCrud.get_pending(db)
+
+        pending_ids = set()
+        for mailing_list in pending:
+            mailing_list_id = mailing_list.get('id')
+            due = mailing_list.get('start_comm_timestamp')
+            pending_ids.add(mailing_list_id)
+            known_condition = (self._due.get(mailing_list_id) == due
+                               or self._started.get(mailing_list_id) == due)
+            if not known_condition:
+                self.cancel(mailing_list_id)
+                self._push(mailing_list_id, due)
+
+        for mailing_list_id in {*self._due, *self._running} - pending_ids:
+            self.cancel(mailing_list_id)
+
+    async def schedule(self, mailing_list_id: int, due: datetime) -> None:
+        async with DBSession() as db:
+            await MailingListCrud.set_state(
+                db, mailing_list_id, MailingListState.scheduled)
+        if self.is_running:
+            self.cancel(mailing_list_id)
+            self._push(mailing_list_id, due.replace(tzinfo=None))
+
+    def cancel(self, mailing_list_id: int) -> None:
+        self._due.pop(mailing_list_id, None)
+        self._started.pop(mailing_list_id, None)
+        task = self._running.pop(mailing_list_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def _poll(self, poll_interval: float) -> None:
+        while True:
+            await asyncio.sleep(poll_interval)
+            await self.refresh()
+
+    def _push(self, mailing_list_id: int, due: datetime) -> None:
+        self._due[mailing_list_id] = due
+        heapq.heappush(self._heap, (due, mailing_list_id))
+        self._wakeup.set()
+
+    async def _loop(self) -> None:
+        while True:
+            self._wakeup.clear()
+            # Entries whose campaign was rescheduled or cancelled are
+            # left in the heap and skipped here.
+            while self._heap and (
+                    self._due.get(self._heap[0][1]) != self._heap[0][0]):
+                heapq.heappop(self._heap)
+
+            timeout = None
+            if self._heap:
+                due, mailing_list_id = self._heap[0]
+                timeout = (due - datetime.utcnow()).total_seconds()
+                if timeout <= 0:
+                    heapq.heappop(self._heap)
+                    del self._due[mailing_list_id]
+                    self._started[mailing_list_id] = due
+                    self._running[mailing_list_id] = asyncio.create_task(
+                        self._run(mailing_list_id, due))
+                    continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _run(self, mailing_list_id: int, due: datetime) -> None:
+        try:
+            async with DBSession() as db:
+                try:
+                    # Another process may have moved the start, so the
+                    # cached row could be stale here.
+                    mailing_list = await MailingListCrud.get(
+                        db, mailing_list_id, use_cache=False)
+                except ValueError:
+                    return
+
+                start_condition = (
+                    mailing_list.get('start_comm_timestamp') == due)
+                if not start_condition:
+                    return
+
+                await MailingListCrud.set_state(
+                    db, mailing_list_id, MailingListState.running)
+                await dispatcher.run(
+                    mailing_list.get('text'), mailing_list_id, db,
+                    mailing_list.get('weight'))
+                await MailingListCrud.set_state(
+                    db, mailing_list_id, MailingListState.done)
+        finally:
+            if self._running.get(mailing_list_id) is asyncio.current_task():
+                del self._running[mailing_list_id]
+                del self._started[mailing_list_id]
+
+
+scheduler = Scheduler()
@@ -1,9 +1,10 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
-from db.base import FilterTypes
+from db.base import FilterTypes, SentStatus
+from mailing_list.templates import compile_template
 
 
 class MailingListFilter(BaseModel):
@@ -11,6 +12,9 @@ class MailingListFilter(BaseModel):
         description='Filter type ("tag"/"mob_code")')
     filter_value: str
 
+    class Config:
+        orm_mode = True
+
 
 class MailingListFilterOut(MailingListFilter):
     id: int
@@ -32,21 +36,66 @@ class MailingListBase(BaseModel):
     start_comm_timestamp: datetime
     end_comm_timestamp: datetime
     text: str
+    weight: int = Field(
+        default=1, ge=1, le=1000,
+        description='Share of the send budget relative to other campaigns')
+
+
+def check_template(text: Optional[str]) -> Optional[str]:
+    if text is not None:
+        compile_template(text)
+    return text
 
 
 class MailingListIn(MailingListBase):
     filters: List[MailingListFilter]
 
+    _check_text = validator('text', allow_reuse=True)(check_template)
+
+
+class MailingListPreviewIn(BaseModel):
+    filters: List[MailingListFilter]
+
+
+class MailingListPreview(BaseModel):
+    audience: int = Field(
+        description='Count clients the filters would reach')
+
 
 class MailingListUpdate(BaseModel):
     start_comm_timestamp: Optional[datetime] = None
     end_comm_timestamp: Optional[datetime] = None
     text: Optional[str] = None
+    weight: Optional[int] = Field(default=None, ge=1, le=1000)
+
+    _check_text = validator('text', allow_reuse=True)(check_template)
 
 
 class MailingListOut(MailingListBase):
     id: int
     filters: List[MailingListFilterOut]
+    messages_created: Optional[int] = Field(
+        default=None,
+        description='Count messages created by this request')
+    messages_removed: Optional[int] = Field(
+        default=None,
+        description='Count unsent messages removed by this request')
 
     class Config:
         orm_mode = True
+
+
+class MessageOut(BaseModel):
+    id: int
+    client_id: Optional[int]
+    mob_number: Optional[int]
+    status: SentStatus
+    sent_time: Optional[datetime]
+    attempts: int
+
+
+class MessagePage(BaseModel):
+    items: List[MessageOut]
+    next_after: Optional[int] = Field(
+        default=None,
+        description='Pass as `after` to get the next page, null at the end')
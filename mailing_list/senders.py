@@ -0,0 +1,109 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from mailing_list.http_client import HttpClient
+
+
+def payload(msg: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'id': msg.get('id'),
+        'phone': msg.get('mob_number'),
+        'text': msg.get('text')
+    }
+
+
+def status_code(value: Any) -> Optional[int]:
+    '''An item status from the API as an int, None if it is not one.'''
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class Sender(ABC):
+    '''
+    Delivers claimed messages to the send API. `send` gets up to
+    `batch_size` messages, each with its rendered `text`, and returns
+    one HTTP-like status per message, in the same order; None means no
+    answer (timeout, connection error or a message missing from the
+    response).
+    '''
+
+    batch_size = 1
+
+    @abstractmethod
+    async def send(self,
+                   msgs: List[Dict[str, Any]],
+                   http: HttpClient) -> List[Optional[int]]:
+        pass
+
+
+class SingleSender(Sender):
+    '''One `{id, phone, text}` POST to `<SEND_API_URL><message id>`.'''
+
+    async def send(self,
+                   msgs: List[Dict[str, Any]],
+                   http: HttpClient) -> List[Optional[int]]:
+        return [
+            await http.post(str(msg.get('message_id')), payload(msg))
+            for msg in msgs
+        ]
+
+
+class BatchSender(Sender):
+    '''
+    Packs up to `batch_size` messages into one POST to
+    `<SEND_API_URL><path>`:
+
+        {"messages": [{"message_id": 1, "id": 7, "phone": 7900..., "text": "..."}]}
+
+    and expects a result per item, matched back by message id:
+
+        {"results": [{"message_id": 1, "status": 200}]}
+
+    A non-2xx response applies its status to every message of the batch.
+    '''
+
+    def __init__(self,
+                 batch_size: int = int(os.getenv('SEND_BATCH_ITEMS', 100)),
+                 path: str = os.getenv('SEND_BATCH_PATH', 'batch')
+                 ) -> None:
+        self.batch_size = batch_size
+        self.path = path
+
+    async def send(self,
+                   msgs: List[Dict[str, Any]],
+                   http: HttpClient) -> List[Optional[int]]:
+        status, body = await http.post_json(self.path, {
+            'messages': [
+                {'message_id': msg.get('message_id'), **payload(msg)}
+                for msg in msgs
+            ]
+        })
+        if not 200 <= status < 300:
+            return [status] * len(msgs)
+
+        results = {}
+        if isinstance(body, dict):
+            for item in body.get('results') or []:
+                if isinstance(item, dict):
+                    results[item.get('message_id')] = status_code(
+                        item.get('status'))
+
+        return [results.get(msg.get('message_id')) for msg in msgs]
+
+
+SENDERS = {
+    'single': SingleSender,
+    'batch': BatchSender
+}
+
+
+def make_sender(mode: str = os.getenv('SEND_MODE', 'single')) -> Sender:
+    if mode not in SENDERS:
+        raise ValueError(
+            f'Unknown SEND_MODE {mode!r}, expected one of {list(SENDERS)}')
+    return SENDERS[mode]()
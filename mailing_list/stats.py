@@ -0,0 +1,32 @@
+'''
+Recomputes the campaign statistic counters from the messages table and
+its archive.
+
+    python -m mailing_list.stats            # every campaign
+    python -m mailing_list.stats 1 2 3      # the given ones
+'''
+import argparse
+import asyncio
+from typing import List
+
+from sqlalchemy.sql import select
+
+from db.base import DBSession
+from mailing_list.crud import recompute_statistic
+from mailing_list.models import MailingList
+
+
+async def repair(mailing_list_ids: List[int]) -> None:
+    async with DBSession() as db:
+        if not mailing_list_ids:
+            mailing_list_ids = (
+                await db.execute(select(MailingList.id))).scalars().all()
+        for mailing_list_id in mailing_list_ids:
+            await recompute_statistic(mailing_list_id, db)
+            print(f'mailing list {mailing_list_id}: recomputed')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('ids', type=int, nargs='*')
+    asyncio.run(repair(parser.parse_args().ids))
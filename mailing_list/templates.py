@@ -0,0 +1,64 @@
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Client fields a message text may refer to, e.g. "Hi {tag} {mob_number}".
+PLACEHOLDERS = ('id', 'mob_number', 'mob_code', 'tag', 'time_zone')
+
+
+class Template:
+    '''
+    Message text with `{field}` placeholders for client fields; `{{` and
+    `}}` stand for literal braces. The text is parsed and validated once
+    and compiled to a list comprehension over an f-string, so rendering
+    a batch costs about as much as formatting it by hand. A text without
+    placeholders is returned as is.
+    '''
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        fields: List[str] = []
+        literals: List[str] = []
+        parts: List[str] = []
+        try:
+            parsed = list(Formatter().parse(text))
+        except ValueError as e:
+            raise ValueError(f'Invalid template: {e}')
+
+        for literal, field, spec, conversion in parsed:
+            literals.append(literal)
+            if literal:
+                parts.append(repr(literal))
+            if field is None:
+                continue
+            if field not in PLACEHOLDERS:
+                raise ValueError(
+                    f'Unknown placeholder {{{field}}}, '
+                    f'expected one of {list(PLACEHOLDERS)}')
+            if spec or conversion:
+                raise ValueError(
+                    f'Placeholder {{{field}}} takes no format spec')
+            if field not in fields:
+                fields.append(field)
+            # Field names are checked above, so the generated code only
+            # ever indexes the message dict with a known key.
+            parts.append(f'f"{{msg[{field!r}]}}"')
+
+        self.fields: Tuple[str, ...] = tuple(fields)
+        self._constant = ''.join(literals)
+        self._render: Optional[
+            Callable[[List[Dict[str, Any]]], List[str]]] = None
+        if fields:
+            self._render = eval(
+                f'lambda msgs: [{" ".join(parts)} for msg in msgs]', {})
+
+    def render_many(self, msgs: List[Dict[str, Any]]) -> List[str]:
+        '''Texts for claimed messages (dicts with the client fields).'''
+        if self._render is None:
+            return [self._constant] * len(msgs)
+        return self._render(msgs)
+
+
+@lru_cache(maxsize=256)
+def compile_template(text: str) -> Template:
+    return Template(text)
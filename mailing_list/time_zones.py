@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+TIME_ZONES = range(-12, 13)
+
+
+def opens_at(start: datetime, time_zone: int) -> datetime:
+    '''UTC moment the campaign window opens for clients in `time_zone`.'''
+    return start - timedelta(hours=time_zone)
+
+
+def closes_at(end: datetime, time_zone: int) -> datetime:
+    return end - timedelta(hours=time_zone)
+
+
+def open_time_zones(start: datetime,
+                    end: datetime,
+                    now: datetime,
+                    time_zones: Iterable[int] = TIME_ZONES) -> List[int]:
+    '''UTC offsets whose local time is inside [start, end] at `now`.'''
+    return [
+        time_zone for time_zone in sorted(time_zones)
+        if opens_at(start, time_zone) <= now <= closes_at(end, time_zone)
+    ]
+
+
+def next_opening(start: datetime,
+                 end: datetime,
+                 now: datetime,
+                 time_zones: Iterable[int] = TIME_ZONES) -> Optional[datetime]:
+    '''Earliest moment after `now` at which one of `time_zones` opens.'''
+    return min(
+        (
+            opens_at(start, time_zone) for time_zone in time_zones
+            if now < opens_at(start, time_zone) <= closes_at(end, time_zone)
+        ),
+        default=None
+    )
@@ -0,0 +1,66 @@
+'''
+Standalone sender process. Run any number of them next to the API
+server (started with SENDER_IN_API=0):
+
+    python -m mailing_list.worker
+
+Workers pick due campaigns up from the shared DB and claim message
+batches atomically, so they never send the same message twice. With
+WORKER_METRICS_PORT set a worker serves its own /metrics.
+'''
+import asyncio
+import os
+import signal
+
+from aiohttp import web
+
+from mailing_list.dispatcher import dispatcher
+from mailing_list.frequency_cap import frequency_cap
+from mailing_list.http_client import http_client
+from mailing_list.scheduler import scheduler
+from metrics.instrumentation import instrument_db, loop_lag_monitor
+from metrics.registry import CONTENT_TYPE, render
+
+
+async def serve_metrics(port: int) -> web.AppRunner:
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            body=render().encode(), headers={'Content-Type': CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    return runner
+
+
+async def main() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    instrument_db()
+    loop_lag_monitor.start()
+    metrics_port = int(os.getenv('WORKER_METRICS_PORT', 0))
+    runner = await serve_metrics(metrics_port) if metrics_port else None
+
+    await http_client.start()
+    await frequency_cap.start()
+    await scheduler.start(
+        poll_interval=float(os.getenv('WORKER_POLL_INTERVAL', 5)))
+    try:
+        await stop.wait()
+    finally:
+        await scheduler.stop()
+        await frequency_cap.stop()
+        await dispatcher.close()
+        await http_client.close()
+        await loop_lag_monitor.stop()
+        if runner is not None:
+            await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
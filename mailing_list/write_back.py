@@ -0,0 +1,81 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from db.base import AsyncSession, SentStatus
+from mailing_list.crud import MessageUpdate
+
+
+class StatusWriter:
+    '''
+    Write-behind buffer for message statuses. Results are collected in
+    memory and written with one bulk UPDATE once `max_size` of them are
+    pending or `max_delay` seconds passed since the first one, whichever
+    comes first. Leaving the `async with` block flushes the rest, also
+    on cancellation. Flushes run one at a time, so `flush` returns only
+    once every result added before it is written.
+    '''
+
+    def __init__(self,
+                 db: AsyncSession,
+                 mailing_list_id: int,
+                 db_lock: Optional[asyncio.Lock] = None,
+                 max_size: int = int(os.getenv('WRITE_BACK_SIZE', 100)),
+                 max_delay: float = int(os.getenv('WRITE_BACK_MS', 500)) / 1000
+                 ) -> None:
+        self.db = db
+        self.mailing_list_id = mailing_list_id
+        self.db_lock = db_lock or asyncio.Lock()
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self._pending: List[Dict[str, Any]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._flushing = asyncio.Lock()
+
+    async def __aenter__(self) -> 'StatusWriter':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.flush()
+
+    async def add(self,
+                  message_id: int,
+                  sent_time: datetime,
+                  status: SentStatus = SentStatus.sent
+                  ) -> None:
+        self._pending.append({
+            'id': message_id,
+            'mailing_list_id': self.mailing_list_id,
+            'sent_time': sent_time,
+            'status': status
+        })
+        if len(self._pending) >= self.max_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.max_delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        # A timer still sleeping is cancelled; one already writing holds
+        # `_flushing` until its UPDATE is done.
+        if self._timer is not None:
+            if self._timer is not asyncio.current_task():
+                self._timer.cancel()
+            self._timer = None
+
+        async with self._flushing:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+
+            try:
+                async with self.db_lock:
+                    await MessageUpdate.update_many(self.db, pending)
+            except BaseException:
+                self._pending = pending + self._pending
+                raise
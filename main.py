@@ -1,9 +1,55 @@
+import os
+
 from fastapi import FastAPI
 
 from clients.router import clients_router
+from db.cache import cache
+from mailing_list.dispatcher import dispatcher
+from mailing_list.frequency_cap import frequency_cap
+from mailing_list.http_client import http_client
 from mailing_list.router import mailing_list_router
+from mailing_list.scheduler import scheduler
+from metrics.instrumentation import MetricsMiddleware, instrument_db, loop_lag_monitor
+from metrics.router import metrics_router
 
 app = FastAPI()
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(router=clients_router)
 app.include_router(router=mailing_list_router)
+app.include_router(router=metrics_router)
+
+
+@app.on_event('startup')
+async def startup():
+    instrument_db()
+    loop_lag_monitor.start()
+    await http_client.start()
+    if os.getenv('SENDER_IN_API', '1') == '1':
+        await frequency_cap.start()
+        await scheduler.start(
+            poll_interval=float(os.getenv('WORKER_POLL_INTERVAL', 5)))
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await scheduler.stop()
+    await frequency_cap.stop()
+    await dispatcher.close()
+    await http_client.close()
+    await loop_lag_monitor.stop()
+
+
+@app.get('/http-pool/')
+async def http_pool():
+    return http_client.stats()
+
+
+@app.get('/cache/')
+async def cache_stats():
+    return cache.stats()
+
+
+@app.get('/frequency-cap/')
+async def frequency_cap_stats():
+    return frequency_cap.stats()
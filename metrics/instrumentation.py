@@ -0,0 +1,165 @@
+import asyncio
+import os
+import re
+import time
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from metrics.registry import Counter, Gauge, Histogram
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'API request latency.',
+    ['router', 'handler', 'method', 'status']
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds',
+    'DB statement execution time.',
+    ['statement']
+)
+SEND_DURATION = Histogram(
+    'send_duration_seconds',
+    'Send API request latency.',
+    ['sender']
+)
+SENT_MESSAGES = Counter(
+    'sent_messages',
+    'Messages handed to the send API, by response status.',
+    ['status']
+)
+SENDS_IN_FLIGHT = Gauge(
+    'sends_in_flight',
+    'Send API requests waiting for a response.'
+)
+QUEUE_DEPTH = Gauge(
+    'sender_queue_depth',
+    'Claimed messages waiting to be sent, per campaign.',
+    ['mailing_list_id']
+)
+LOOP_LAG = Gauge(
+    'event_loop_lag_seconds',
+    'How late the last event loop lag probe woke up.'
+)
+LOOP_LAG_HISTOGRAM = Histogram(
+    'event_loop_lag_probe_seconds',
+    'How late event loop lag probes wake up.'
+)
+
+
+class MetricsMiddleware:
+    '''
+    ASGI middleware timing every HTTP request. The router label is the
+    module of the matched endpoint (`clients`, `mailing_list`, ...).
+    '''
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            endpoint = scope.get('endpoint')
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started,
+                router=(endpoint.__module__.split('.')[0]
+                        if endpoint else 'none'),
+                handler=endpoint.__name__ if endpoint else 'none',
+                method=scope['method'],
+                status=status
+            )
+
+
+STATEMENT = re.compile(
+    r'^\s*(?:(SELECT)\b.*?\bFROM|(INSERT)\s+(?:OR\s+\w+\s+)?INTO|(UPDATE)'
+    r'|(DELETE)\s+FROM)\s+"?(\w+)',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+def statement_name(statement: str) -> str:
+    '''
+    `<verb> <table>`, e.g. `update messages`, unless the statement was
+    executed with a `metric_name` execution option.
+    '''
+    match = STATEMENT.match(statement)
+    if not match:
+        return statement.split(None, 1)[0].lower() if statement else ''
+    verb = next(filter(None, match.groups()[:4]))
+    return f'{verb} {match.group(5)}'.lower()
+
+
+def instrument_db(target=Engine) -> None:
+    '''Times statements of `target`, by default of every engine.'''
+    if event.contains(target, 'before_cursor_execute', _before_execute):
+        return
+    event.listen(target, 'before_cursor_execute', _before_execute)
+    event.listen(target, 'after_cursor_execute', _after_execute)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, many):
+    # Kept on the execution context, so a statement that fails leaves
+    # nothing behind for the next one to pick up.
+    context._query_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, many):
+    started = getattr(context, '_query_started', None)
+    if started is None:
+        return
+    name = (context.execution_options.get('metric_name')
+            or statement_name(statement))
+    DB_QUERY_DURATION.observe(time.perf_counter() - started, statement=name)
+
+
+class LoopLagMonitor:
+    '''
+    Sleeps `interval` seconds in a loop and records how much later than
+    asked it woke up: time the event loop spent on other callbacks.
+    '''
+
+    def __init__(self,
+                 interval: float = float(os.getenv('LOOP_LAG_INTERVAL', 0.5))
+                 ) -> None:
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            LOOP_LAG.set(lag)
+            LOOP_LAG_HISTOGRAM.observe(lag)
+
+
+loop_lag_monitor = LoopLagMonitor()
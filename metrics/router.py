@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from metrics.registry import CONTENT_TYPE, render
+
+metrics_router = APIRouter(
+    tags=['metrics', ]
+)
+
+
+@metrics_router.get('/metrics')
+async def metrics():
+    return Response(render(), headers={'Content-Type': CONTENT_TYPE})
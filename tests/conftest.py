@@ -0,0 +1,100 @@
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+from clients.models import Client
+from db.base import Base, DBSession, MailingListState, engine, make_engine
+from db.cache import cache
+from main import app
+from mailing_list.models import MailingList, MailingListStats, Message
+
+
+# e.g. postgresql+asyncpg://postgres@localhost/mailing_test; its tables
+# are dropped and created again for every test.
+TEST_DATABASE_URL = os.getenv('TEST_DATABASE_URL')
+
+
+@pytest.fixture
+def session_maker(tmp_path):
+    '''
+    Binds DBSession to empty tables for the test: a fresh SQLite file,
+    or the TEST_DATABASE_URL database.
+    '''
+    if TEST_DATABASE_URL:
+        # Each asyncio.run has its own loop, so connections are not kept.
+        scratch = create_async_engine(TEST_DATABASE_URL, poolclass=NullPool)
+    else:
+        scratch = make_engine(f'sqlite+aiosqlite:///{tmp_path / "test.db"}')
+
+    async def create() -> None:
+        async with scratch.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    DBSession.configure(bind=scratch)
+    cache.clear()
+    yield sessionmaker(scratch, class_=AsyncSession, expire_on_commit=False)
+    DBSession.configure(bind=engine)
+    cache.clear()
+    asyncio.run(scratch.dispose())
+
+
+@pytest.fixture
+def api(session_maker):
+    '''The API without its startup hooks, so no sender runs.'''
+    os.environ.setdefault('SENDER_IN_API', '0')
+    return TestClient(app)
+
+
+@pytest.fixture
+def seed_campaign(session_maker):
+    '''
+    seed_campaign(clients, **columns) adds a campaign with one pending
+    message for each of the clients 1..`clients`, created as needed, and
+    returns its id. The campaign window is open now; `finished=True`
+    makes it a campaign that ended two days ago.
+    '''
+    async def seed(clients: int, finished: bool = False, **columns) -> int:
+        now = datetime.utcnow()
+        if finished:
+            columns = {
+                'start_comm_timestamp': now - timedelta(days=3),
+                'end_comm_timestamp': now - timedelta(days=2),
+                'state': MailingListState.done,
+                **columns
+            }
+        async with session_maker() as db:
+            existing = set((await db.execute(select(Client.id))).scalars())
+            missing = [i for i in range(1, clients + 1) if i not in existing]
+            if missing:
+                await db.execute(insert(Client), [
+                    {'id': i, 'mob_number': 79000000000 + i,
+                     'mob_code': '900', 'tag': 'seeded', 'time_zone': 0}
+                    for i in missing
+                ])
+            mailing_list = MailingList(**{
+                'start_comm_timestamp': now - timedelta(hours=1),
+                'end_comm_timestamp': now + timedelta(hours=1),
+                'text': 'seeded',
+                'stats': MailingListStats(),
+                **columns
+            })
+            db.add(mailing_list)
+            await db.flush()
+            await db.execute(insert(Message), [
+                {'mailing_list_id': mailing_list.id, 'client_id': i,
+                 'time_zone': 0}
+                for i in range(1, clients + 1)
+            ])
+            await db.commit()
+            return mailing_list.id
+
+    return lambda clients, **columns: asyncio.run(seed(clients, **columns))
@@ -0,0 +1,51 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from mailing_list.archive import archive
+from mailing_list.models import ArchivedMessage, Message
+
+
+def test_archived_ids_are_not_reused(session_maker, seed_campaign):
+    async def query(stmt):
+        async with session_maker() as db:
+            return (await db.execute(stmt)).scalars().all()
+
+    seed_campaign(3, finished=True)
+    asyncio.run(archive(chunk=2, older_than=86400))
+    [archived_max] = asyncio.run(
+        query(select(func.max(ArchivedMessage.id))))
+
+    seed_campaign(3, finished=True)
+    new_ids = asyncio.run(query(select(Message.id)))
+    asyncio.run(archive(chunk=2, older_than=86400))
+
+    assert min(new_ids) > archived_max
+    assert sorted(asyncio.run(query(select(ArchivedMessage.id)))) == list(
+        range(1, 7))
+    assert asyncio.run(query(select(func.count(Message.id)))) == [0]
+
+
+def test_archived_campaigns_cannot_be_edited(
+        api, session_maker, seed_campaign):
+    id = seed_campaign(1, finished=True)
+    asyncio.run(archive(chunk=10, older_than=86400))
+    filter_ = {'filter_type': 'tag', 'filter_value': 'seeded'}
+
+    responses = [
+        api.put(f'/mailing-list/{id}/', json={'text': 'again'}),
+        api.post(f'/mailing-list/{id}/filter/', json=filter_),
+        api.put(f'/mailing-list/{id}/filter/1/', json=filter_),
+        api.delete(f'/mailing-list/{id}/filter/1/'),
+    ]
+    assert [r.status_code for r in responses] == [409] * 4
+
+    async def counts():
+        async with session_maker() as db:
+            return (
+                (await db.execute(select(func.count(Message.id)))).scalar(),
+                (await db.execute(
+                    select(func.count(ArchivedMessage.id)))).scalar()
+            )
+
+    assert asyncio.run(counts()) == (0, 1)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from sqlalchemy import update
+
+from clients.models import Client
+from db.cache import Cache, CacheBackend, LocalBackend
+from mailing_list.models import MailingList
+
+FILTER = {'filter_type': 'tag', 'filter_value': 'a'}
+
+
+def test_backend_must_implement_every_method():
+    class Partial(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_shared_backend_serves_other_processes():
+    backend = LocalBackend()
+    first, second = Cache(backend=backend), Cache(backend=backend)
+
+    async def run():
+        await first.set('client:1', {'id': 1})
+        assert await second.get('client:1') == {'id': 1}
+        await first.invalidate('client:1')
+        second.clear()
+        assert await second.get('client:1') is None
+
+    asyncio.run(run())
+    assert second.stats()['backend_hits'] == 1
+
+
+def test_filter_writes_invalidate_the_cached_campaign(api):
+    created = api.post('/mailing-list/', json={
+        'start_comm_timestamp': '2030-01-01T00:00:00',
+        'end_comm_timestamp': '2030-01-02T00:00:00',
+        'text': 'cached',
+        'filters': [FILTER]
+    }).json()
+    id = created['id']
+    assert api.get(f'/mailing-list/{id}/').json()['filters'][0][
+        'filter_value'] == 'a'
+
+    filter_id = created['filters'][0]['id']
+    api.put(f'/mailing-list/{id}/filter/{filter_id}/',
+            json={**FILTER, 'filter_value': 'b'})
+    assert api.get(f'/mailing-list/{id}/').json()['filters'][0][
+        'filter_value'] == 'b'
+
+
+def test_updates_do_not_write_back_stale_cached_fields(api, session_maker):
+    client = api.post('/clients/', json={
+        'mob_number': 79000000001, 'mob_code': '900', 'tag': 'old',
+        'time_zone': 0
+    }).json()
+    mailing_list = api.post('/mailing-list/', json={
+        'start_comm_timestamp': '2030-01-01T00:00:00',
+        'end_comm_timestamp': '2030-01-02T00:00:00',
+        'text': 'old',
+        'filters': [FILTER]
+    }).json()
+    # Both are cached now.
+    api.get(f'/clients/{client["id"]}/')
+    api.get(f'/mailing-list/{mailing_list["id"]}/')
+
+    async def write_elsewhere() -> None:
+        # Another API process: this one's cache is not invalidated.
+        async with session_maker() as db:
+            await db.execute(update(Client).values(tag='new'))
+            await db.execute(update(MailingList).values(text='new'))
+            await db.commit()
+
+    asyncio.run(write_elsewhere())
+    assert api.put(f'/clients/{client["id"]}/',
+                   json={'time_zone': 3}).json()['tag'] == 'new'
+    assert api.put(f'/mailing-list/{mailing_list["id"]}/',
+                   json={'weight': 2}).json()['text'] == 'new'
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from typing import AsyncIterator, List
+
+from sqlalchemy import select
+
+from clients.importer import iter_client_chunks
+from db.base import SentStatus
+from mailing_list.models import Message
+
+CLIENT = {'mob_number': 79000000001, 'mob_code': 900, 'tag': 'a',
+          'time_zone': 0}
+
+
+async def body(lines: List[str]) -> AsyncIterator[bytes]:
+    for line in lines:
+        yield (line + '\n').encode()
+
+
+def collect(lines: List[str], chunk_size: int, max_errors: int):
+    async def run():
+        return [chunk async for chunk in iter_client_chunks(
+            body(lines), 'application/x-ndjson', chunk_size, max_errors)]
+    return asyncio.run(run())
+
+
+def test_invalid_rows_are_flushed_in_chunks():
+    chunks = collect(['{"mob_number": 1}'] * 10, 3, 2)
+
+    assert [failed for _, _, failed in chunks] == [3, 3, 3, 1]
+    assert sum(len(errors) for _, errors, _ in chunks) == 2
+    assert all(not clients for clients, _, _ in chunks)
+
+
+def test_bulk_import_reports_every_failed_row(api):
+    lines = ['{"mob_number": 79000000001, "mob_code": 900, "tag": "a", '
+             '"time_zone": 0}'] + ['not json'] * 5
+    response = api.post(
+        '/clients/bulk', data='\n'.join(lines),
+        headers={'content-type': 'application/x-ndjson'})
+
+    assert response.status_code == 200
+    assert response.json()['upserted'] == 1
+    assert response.json()['failed'] == 5
+
+
+def test_client_round_trip_keeps_number_and_code(api):
+    # 79999999999 overflows a 32-bit column, e.g. int4 on PostgreSQL.
+    created = api.post(
+        '/clients/', json={**CLIENT, 'mob_number': 79999999999}).json()
+    client = api.get(f'/clients/{created["id"]}/').json()
+    assert client['mob_number'] == 79999999999
+    assert client['mob_code'] == '900'
+
+
+def test_duplicate_mob_number_is_a_conflict(api):
+    assert api.post('/clients/', json=CLIENT).status_code == 201
+    assert api.post('/clients/', json=CLIENT).status_code == 409
+
+    other = api.post(
+        '/clients/', json={**CLIENT, 'mob_number': 79000000002}).json()
+    response = api.put(
+        f'/clients/{other["id"]}/', json={'mob_number': 79000000001})
+    assert response.status_code == 409
+
+
+def test_bulk_import_moves_pending_messages_to_new_time_zone(
+        api, session_maker):
+    created = api.post('/clients/', json=CLIENT).json()
+
+    async def seed():
+        async with session_maker() as db:
+            db.add_all([
+                Message(client_id=created['id'], time_zone=0,
+                        status=status)
+                for status in SentStatus
+            ])
+            await db.commit()
+
+    asyncio.run(seed())
+    response = api.post(
+        '/clients/bulk', data=json.dumps({**CLIENT, 'time_zone': 5}),
+        headers={'content-type': 'application/x-ndjson'})
+    assert response.json()['upserted'] == 1
+
+    async def zones():
+        async with session_maker() as db:
+            rows = await db.execute(select(Message.status, Message.time_zone))
+            return dict(rows.all())
+
+    assert asyncio.run(zones()) == {
+        SentStatus.no_sent: 5, SentStatus.in_progress: 5,
+        SentStatus.sent: 0, SentStatus.failed: 0}
@@ -0,0 +1,108 @@
+import asyncio
+
+from sqlalchemy import select, update
+
+from db.base import SentStatus
+from mailing_list.crud import MessageUpdate
+from mailing_list.dispatcher import Dispatcher
+from mailing_list.frequency_cap import FrequencyCap
+from mailing_list.http_client import HttpClient
+from mailing_list.models import MailingList, Message
+from mailing_list.senders import Sender
+
+
+class RecordingSender(Sender):
+    '''Answers `status` to every message and records what was sent.'''
+
+    def __init__(self, status: int = 200, batch_size: int = 1) -> None:
+        self.status = status
+        self.batch_size = batch_size
+        self.texts = []
+        self.weights = []
+        self.dispatcher = None
+        self.mailing_list_id = None
+
+    async def send(self, msgs, http):
+        self.texts.extend(msg.get('text') for msg in msgs)
+        flow = self.dispatcher.fair_queue.flows[self.mailing_list_id]
+        self.weights.append(flow.weight)
+        return [self.status] * len(msgs)
+
+
+def run(session_maker, sender: RecordingSender, text: str,
+        mailing_list_id: int, weight: int = 1, **options) -> int:
+    async def main() -> int:
+        http = HttpClient(base_url='http://127.0.0.1:1/')
+        dispatcher = Dispatcher(
+            **{'concurrency': 1, 'batch_size': 1, **options},
+            http=http, sender=sender, frequency_cap=FrequencyCap(limit=0))
+        sender.dispatcher = dispatcher
+        sender.mailing_list_id = mailing_list_id
+        try:
+            async with session_maker() as db:
+                return await dispatcher.run(
+                    text, mailing_list_id, db, weight)
+        finally:
+            await http.close()
+
+    return asyncio.run(main())
+
+
+def test_weight_changed_elsewhere_reaches_the_running_campaign(
+        session_maker, seed_campaign):
+    mailing_list_id = seed_campaign(4, text='weights')
+    sender = RecordingSender()
+    send = sender.send
+
+    async def change_weight_after_first_send(msgs, http):
+        statuses = await send(msgs, http)
+        if len(sender.weights) == 1:
+            # What PUT /mailing-list/{id}/ does in an API process that
+            # does not run this campaign.
+            async with session_maker() as db:
+                await db.execute(
+                    update(MailingList).
+                    where(MailingList.id == mailing_list_id).
+                    values(weight=5))
+                await db.commit()
+        return statuses
+
+    sender.send = change_weight_after_first_send
+    assert run(session_maker, sender, 'weights', mailing_list_id) == 4
+    assert sender.weights[0] == 1
+    assert sender.weights[-1] == 5
+
+
+def test_legacy_text_with_stray_braces_is_sent_verbatim(
+        session_maker, seed_campaign):
+    text = 'Sale {50% off} today } {unknown}'
+    mailing_list_id = seed_campaign(2, text=text)
+    sender = RecordingSender()
+
+    assert run(session_maker, sender, text, mailing_list_id) == 2
+    assert sender.texts == [text, text]
+
+
+def test_failed_batch_is_written_in_one_statement(
+        session_maker, seed_campaign, monkeypatch):
+    mailing_list_id = seed_campaign(4, text='failing')
+    fail = MessageUpdate.fail
+    calls = []
+
+    async def recording_fail(db, retry_at):
+        calls.append(dict(retry_at))
+        await fail(db, retry_at)
+
+    monkeypatch.setattr(MessageUpdate, 'fail', recording_fail)
+    sender = RecordingSender(status=500, batch_size=4)
+    assert run(session_maker, sender, 'failing', mailing_list_id,
+               batch_size=4, max_attempts=1) == 0
+    assert [len(call) for call in calls] == [4]
+
+    async def statuses():
+        async with session_maker() as db:
+            return (await db.execute(
+                select(Message.status, Message.attempts))).all()
+
+    assert asyncio.run(statuses()) == [(SentStatus.failed, 1)] * 4
+
@@ -0,0 +1,106 @@
+import asyncio
+from collections import Counter
+
+from mailing_list.fair_queue import FairQueue
+
+
+async def drain(queue: FairQueue, weights, grants: int, gate=None):
+    '''
+    Flows {flow id: weight} keep requests of cost 1 waiting, each done
+    as soon as it is granted; returns how many of the first `grants`
+    grants each flow got. With `gate`, one pass is put in it per grant.
+    '''
+    granted = Counter()
+
+    async def request(flow_id: int) -> None:
+        await queue.acquire(flow_id)
+        granted[flow_id] += 1
+        queue.release(flow_id)
+
+    tasks = []
+    for flow_id, weight in weights.items():
+        queue.register(flow_id, weight)
+        tasks += [asyncio.create_task(request(flow_id))
+                  for _ in range(grants)]
+    await asyncio.sleep(0)
+
+    for done in range(1, grants + 1):
+        if gate is not None:
+            await gate.put(None)
+        elif done == 1:
+            queue.release(0)
+        while sum(granted.values()) < done:
+            await asyncio.sleep(0)
+    result = dict(granted)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return result
+
+
+def test_grants_at_once_with_free_capacity():
+    async def run() -> None:
+        queue = FairQueue(capacity=2)
+        await queue.acquire(1)
+        await queue.acquire(2)
+        assert queue.in_flight == 2
+        assert queue.stats()['campaigns'][1]['in_flight'] == 1
+
+    asyncio.run(run())
+
+
+def test_capacity_is_shared_by_weight():
+    async def run():
+        queue = FairQueue(capacity=1)
+        # Holds the only slot until every request waits.
+        await queue.acquire(0)
+        return await drain(queue, {1: 1, 2: 3}, 40)
+
+    granted = asyncio.run(run())
+    assert granted == {1: 10, 2: 30}
+
+
+def test_gate_budget_is_shared_by_weight():
+    async def run():
+        passes = asyncio.Queue()
+        queue = FairQueue(capacity=100, gate=passes.get)
+        return await drain(queue, {1: 1, 2: 9}, 50, gate=passes)
+
+    assert asyncio.run(run()) == {1: 5, 2: 45}
+
+
+def test_cancelled_waiter_gives_its_pass_back():
+    async def run():
+        passes = asyncio.Queue()
+        returned = []
+
+        async def ungate() -> None:
+            returned.append(None)
+
+        queue = FairQueue(capacity=1, gate=passes.get, ungate=ungate)
+        waiter = asyncio.create_task(queue.acquire(1))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        await passes.put(None)
+        for _ in range(3):
+            await asyncio.sleep(0)
+        return queue.in_flight, len(returned), queue._pump
+
+    assert asyncio.run(run()) == (0, 1, None)
+
+
+def test_register_updates_weight_and_unregister_keeps_busy_flows():
+    async def run() -> FairQueue:
+        queue = FairQueue(capacity=1)
+        queue.register(1, 2)
+        queue.register(1, 5)
+        await queue.acquire(1)
+        queue.unregister(1)
+        return queue
+
+    queue = asyncio.run(run())
+    assert queue.flows[1].weight == 5
+    queue.release(1)
+    queue.unregister(1)
+    assert 1 not in queue.flows
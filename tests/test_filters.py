@@ -0,0 +1,74 @@
+import asyncio
+
+from sqlalchemy import select, update
+
+from db.base import SentStatus
+from mailing_list.models import Message
+
+CLIENTS = [
+    {'mob_number': 79000000001, 'mob_code': '900', 'tag': 'a'},
+    {'mob_number': 79000000002, 'mob_code': '901', 'tag': 'a'},
+    {'mob_number': 79000000003, 'mob_code': '900', 'tag': 'b'},
+    {'mob_number': 79000000004, 'mob_code': '902', 'tag': 'b'},
+]
+
+
+def recipients(session_maker):
+    '''{mob_number: status} of the campaign's messages.'''
+    async def run():
+        async with session_maker() as db:
+            rows = await db.execute(select(Message.client_id, Message.status))
+            return {79000000000 + client_id: status
+                    for client_id, status in rows}
+    return asyncio.run(run())
+
+
+def test_filter_changes_keep_clients_matched_by_other_filters(
+        api, session_maker):
+    for client in CLIENTS:
+        api.post('/clients/', json={**client, 'time_zone': 0})
+    created = api.post('/mailing-list/', json={
+        'start_comm_timestamp': '2030-01-01T00:00:00',
+        'end_comm_timestamp': '2030-01-02T00:00:00',
+        'text': 'filters',
+        'filters': [{'filter_type': 'tag', 'filter_value': 'a'},
+                    {'filter_type': 'mob_code', 'filter_value': '900'}]
+    }).json()
+    id = created['id']
+    tag_a, code_900 = (f['id'] for f in created['filters'])
+    assert sorted(recipients(session_maker)) == [
+        79000000001, 79000000002, 79000000003]
+
+    # Only client 4 is new to the campaign.
+    added = api.post(f'/mailing-list/{id}/filter/',
+                     json={'filter_type': 'tag', 'filter_value': 'b'}).json()
+    assert added['messages_created'] == 1
+    tag_b = max(f['id'] for f in added['filters'])
+
+    # Client 3 is still matched by mob_code 900.
+    removed = api.delete(f'/mailing-list/{id}/filter/{tag_b}/').json()
+    assert removed['messages_removed'] == 1
+    assert 79000000004 not in recipients(session_maker)
+
+    # 900 -> 902: client 1 stays through tag a, 3 leaves, 4 joins.
+    changed = api.put(f'/mailing-list/{id}/filter/{code_900}/', json={
+        'filter_type': 'mob_code', 'filter_value': '902'}).json()
+    assert (changed['messages_created'], changed['messages_removed']) == (
+        1, 1)
+    assert sorted(recipients(session_maker)) == [
+        79000000001, 79000000002, 79000000004]
+
+    # Messages already sent are kept when their client leaves.
+    async def mark_sent() -> None:
+        async with session_maker() as db:
+            await db.execute(
+                update(Message).
+                where(Message.client_id == 2).
+                values(status=SentStatus.sent))
+            await db.commit()
+
+    asyncio.run(mark_sent())
+    removed = api.delete(f'/mailing-list/{id}/filter/{tag_a}/').json()
+    assert removed['messages_removed'] == 1
+    assert recipients(session_maker) == {
+        79000000002: SentStatus.sent, 79000000004: SentStatus.no_sent}
@@ -0,0 +1,100 @@
+import asyncio
+import re
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from benchmarks.stub_api import stub_api
+from mailing_list.dispatcher import Dispatcher
+from mailing_list.frequency_cap import FrequencyCap
+from mailing_list.http_client import HttpClient
+from mailing_list.senders import SingleSender
+from metrics.instrumentation import instrument_db
+from metrics.registry import Metric
+
+
+def sample(api, name: str, **labels) -> float:
+    '''Value of one sample of GET /metrics, 0 if it is not there yet.'''
+    response = api.get('/metrics')
+    assert response.status_code == 200
+    wanted = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = re.escape(f'{name}{{{wanted}}}' if wanted else name)
+    match = re.search(rf'^{pattern} (\S+)$', response.text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def test_send_and_db_metrics_against_stub_api(
+        api, session_maker, seed_campaign):
+    instrument_db()
+    sent_before = sample(api, 'sent_messages_total', status=200)
+    sends_before = sample(
+        api, 'send_duration_seconds_count', sender='SingleSender')
+    claims_before = sample(
+        api, 'db_query_duration_seconds_count', statement='claim_msgs')
+
+    mailing_list_id = seed_campaign(5, text='metrics')
+
+    async def run() -> int:
+        async with stub_api() as url:
+            http = HttpClient(base_url=url)
+            dispatcher = Dispatcher(
+                concurrency=2, http=http, sender=SingleSender(),
+                frequency_cap=FrequencyCap(limit=0))
+            try:
+                async with session_maker() as db:
+                    return await dispatcher.run(
+                        'metrics', mailing_list_id, db)
+            finally:
+                await http.close()
+
+    assert asyncio.run(run()) == 5
+    assert sample(api, 'sent_messages_total', status=200) == sent_before + 5
+    assert sample(api, 'send_duration_seconds_count',
+                  sender='SingleSender') == sends_before + 5
+    assert sample(api, 'send_duration_seconds_bucket',
+                  sender='SingleSender', le='+Inf') == sends_before + 5
+    assert sample(api, 'db_query_duration_seconds_count',
+                  statement='claim_msgs') > claims_before
+    assert sample(api, 'sends_in_flight') == 0
+
+
+def test_failed_statement_is_not_timed(api, session_maker):
+    instrument_db()
+    before = sample(
+        api, 'db_query_duration_seconds_count', statement='select clients')
+    seconds_before = sample(
+        api, 'db_query_duration_seconds_sum', statement='select clients')
+
+    async def run() -> None:
+        async with session_maker() as db:
+            with pytest.raises(DBAPIError):
+                await db.execute(text('SELECT * FROM missing_table'))
+            await db.rollback()
+            await asyncio.sleep(0.2)
+            await db.execute(text('SELECT id FROM clients'))
+
+    asyncio.run(run())
+    assert sample(api, 'db_query_duration_seconds_count',
+                  statement='select missing_table') == 0
+    assert sample(api, 'db_query_duration_seconds_count',
+                  statement='select clients') == before + 1
+    # Timed from its own start, not from the failed statement's.
+    assert sample(api, 'db_query_duration_seconds_sum',
+                  statement='select clients') - seconds_before < 0.2
+
+
+def test_http_requests_are_timed(api):
+    before = sample(
+        api, 'http_request_duration_seconds_count',
+        router='clients', handler='get_client', method='GET', status=404)
+    assert api.get('/clients/1/').status_code == 404
+    assert sample(
+        api, 'http_request_duration_seconds_count',
+        router='clients', handler='get_client', method='GET',
+        status=404) == before + 1
+
+
+def test_metric_types_must_render_samples():
+    with pytest.raises(TypeError):
+        Metric('unrendered', 'Metric without samples')
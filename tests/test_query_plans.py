@@ -0,0 +1,17 @@
+import asyncio
+
+from db.query_plans import find_scans, unselective
+
+
+def test_hot_queries_use_selective_indexes():
+    assert asyncio.run(find_scans()) == []
+
+
+def test_searches_on_enum_columns_alone_are_flagged():
+    assert unselective(
+        'SEARCH messages USING INDEX ix_messages_status_sent_time (status=?)')
+    assert not unselective(
+        'SEARCH messages USING INDEX ix_messages_mailing_list_status '
+        '(mailing_list_id=? AND status=?)')
+    assert not unselective(
+        'SEARCH messages USING INTEGER PRIMARY KEY (rowid=?)')
@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from mailing_list.dispatcher import request_status
+from mailing_list.senders import BatchSender, Sender
+
+
+class FakeHttp:
+
+    def __init__(self, body):
+        self.body = body
+
+    async def post_json(self, path, payload):
+        return 200, self.body
+
+
+def test_batch_sender_drops_statuses_that_are_not_integers():
+    msgs = [{'message_id': i, 'id': i, 'mob_number': 7, 'text': 'x'}
+            for i in range(1, 6)]
+    http = FakeHttp({'results': [
+        {'message_id': 1, 'status': 200},
+        {'message_id': 2, 'status': '500'},
+        {'message_id': 3, 'status': None},
+        {'message_id': 4, 'status': 'sent'},
+        {'message_id': 5, 'status': True},
+    ]})
+
+    statuses = asyncio.run(BatchSender(batch_size=5).send(msgs, http))
+
+    assert statuses == [200, 500, None, None, None]
+    assert request_status(statuses) == 200
+
+
+def test_sender_must_implement_send():
+    with pytest.raises(TypeError):
+        Sender()
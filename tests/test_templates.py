@@ -0,0 +1,28 @@
+import pytest
+
+from mailing_list.templates import Template, compile_template
+
+MSG = {'id': 7, 'mob_number': 79000000007, 'mob_code': '900', 'tag': 'vip',
+       'time_zone': 3}
+
+
+def test_placeholders_are_rendered_and_braces_escaped():
+    template = compile_template('Hi {tag} ({mob_code}), {{50% off}}')
+    assert template.render_many([MSG]) == ['Hi vip (900), {50% off}']
+    assert Template('plain').render_many([MSG, MSG]) == ['plain', 'plain']
+
+
+@pytest.mark.parametrize('text', ['Sale {50% off}', 'Hi {name}', '{tag!r}'])
+def test_invalid_texts_are_rejected(text):
+    with pytest.raises(ValueError):
+        Template(text)
+
+
+def test_legacy_text_survives_other_updates(api, seed_campaign):
+    id = seed_campaign(1, text='Sale {50% off}')
+
+    response = api.put(f'/mailing-list/{id}/', json={'weight': 3})
+    assert response.status_code == 200
+    assert response.json()['text'] == 'Sale {50% off}'
+    assert api.put(f'/mailing-list/{id}/',
+                   json={'text': 'Sale {50% off}'}).status_code == 422
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+
+from mailing_list.time_zones import next_opening, open_time_zones
+
+# Campaign window 09:00-10:00 local time of every client.
+START = datetime(2030, 1, 1, 9)
+END = datetime(2030, 1, 1, 10)
+
+
+def test_window_opens_east_first():
+    # 06:00 UTC is 09:00 at UTC+3, 10:00 at UTC+4.
+    assert open_time_zones(START, END, datetime(2030, 1, 1, 6)) == [3, 4]
+    assert open_time_zones(START, END, datetime(2030, 1, 1, 6, 30)) == [3]
+    # Both ends of the window are inclusive.
+    assert open_time_zones(START, END, datetime(2030, 1, 1, 9)) == [0, 1]
+    assert open_time_zones(START, END, datetime(2030, 1, 1, 23)) == []
+
+
+def test_only_pending_time_zones_are_considered():
+    now = datetime(2030, 1, 1, 6)
+    assert open_time_zones(START, END, now, [4, 0, 3]) == [3, 4]
+    assert open_time_zones(START, END, now, [0, -5]) == []
+
+
+def test_next_opening_is_the_nearest_pending_zone():
+    now = datetime(2030, 1, 1, 6, 30)
+    # UTC+2 opens at 07:00 UTC, UTC0 at 09:00, UTC-5 at 14:00.
+    assert next_opening(START, END, now) == datetime(2030, 1, 1, 7)
+    assert next_opening(START, END, now, [0, -5]) == datetime(2030, 1, 1, 9)
+    assert next_opening(START, END, now, [-5]) == datetime(2030, 1, 1, 14)
+
+
+def test_no_opening_once_every_pending_zone_opened():
+    now = datetime(2030, 1, 1, 9, 30)
+    assert next_opening(START, END, now, [0, 3, 12]) is None
+    # A zone opening right now is open already, not next.
+    assert next_opening(START, END, START - timedelta(hours=3), [3]) is None
@@ -0,0 +1,33 @@
+import asyncio
+from datetime import datetime
+
+from mailing_list.crud import MessageUpdate
+from mailing_list.write_back import StatusWriter
+
+
+def test_flush_waits_for_a_timer_flush_in_progress(monkeypatch):
+    written = []
+    writing = 0
+    overlapped = False
+
+    async def slow_update_many(db, values):
+        nonlocal writing, overlapped
+        writing += 1
+        overlapped = overlapped or writing > 1
+        await asyncio.sleep(0.05)
+        written.extend(value['id'] for value in values)
+        writing -= 1
+
+    monkeypatch.setattr(MessageUpdate, 'update_many', slow_update_many)
+
+    async def run() -> None:
+        writer = StatusWriter(None, 1, max_size=10, max_delay=0.01)
+        await writer.add(1, datetime.utcnow())
+        # The timer fires and is now in the middle of its UPDATE.
+        await asyncio.sleep(0.03)
+        await writer.flush()
+        assert written == [1]
+        assert not writer._pending
+
+    asyncio.run(run())
+    assert not overlapped